@@ -0,0 +1,104 @@
+import asyncio
+import time
+import typing as t
+from dataclasses import dataclass
+
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Scope
+
+from starlette_login.backends import SessionAuthBackend
+from starlette_login.login_manager import Config, LoginManager
+from starlette_login.middleware import AuthenticationMiddleware
+from starlette_login.mixins import BaseUser
+
+
+@dataclass
+class User(BaseUser):
+    id: int
+    username: str
+
+    @property
+    def is_authenticated(self) -> bool:
+        return True
+
+    @property
+    def display_name(self) -> str:
+        return self.username
+
+    @property
+    def identity(self) -> int:
+        return self.id
+
+
+USERS = {i: User(i, f"user{i}") for i in range(1, 10001)}
+
+
+def user_loader(conn: HTTPConnection, user_id: int) -> t.Any:
+    return USERS.get(int(user_id))
+
+
+def create_login_manager(config: t.Optional[Config] = None) -> LoginManager:
+    manager = LoginManager(
+        redirect_to="/login", secret_key="benchmark", config=config
+    )
+    manager.set_user_loader(user_loader)
+    return manager
+
+
+def wrap(app: ASGIApp, manager: LoginManager, **kwargs: t.Any) -> ASGIApp:
+    return AuthenticationMiddleware(
+        app, SessionAuthBackend(manager), manager, **kwargs
+    )
+
+
+def http_scope(
+    path: str = "/",
+    session: t.Optional[t.Dict[str, t.Any]] = None,
+    headers: t.Optional[t.List[t.Tuple[bytes, bytes]]] = None,
+) -> Scope:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 50000),
+        "root_path": "",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"host", b"testserver")] + list(headers or []),
+        "session": dict(session or {}),
+    }
+
+
+async def receive() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message: Message) -> None:
+    pass
+
+
+async def call(app: ASGIApp, scope: Scope) -> None:
+    await app(dict(scope, session=dict(scope["session"])), receive, send)
+
+
+def timeit(
+    func: t.Callable[[], t.Awaitable[t.Any]],
+    number: int,
+    repeat: int = 5,
+) -> float:
+    """Best mean time of `number` awaited calls of `func`, in seconds"""
+
+    async def run() -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                await func()
+            best = min(best, (time.perf_counter() - start) / number)
+        return best
+
+    return asyncio.run(run())
@@ -0,0 +1,99 @@
+"""`LoginManager.set_cookie` with the pre-rendered `CookieTemplate` against
+the previous `SimpleCookie` + `MutableHeaders` implementation.
+
+    python -m benchmarks.cookie
+"""
+
+import http.cookies
+import time
+import timeit
+import typing as t
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import Message
+
+from starlette_login.login_manager import Config, LoginManager
+
+NUMBER = 20000
+
+
+def simple_cookie_set_cookie(
+    manager: LoginManager, message: Message, user_id: t.Any
+) -> Message:
+    """`LoginManager.set_cookie` before the cookie template"""
+    key = manager.config.COOKIE_NAME
+    expires = int(manager.config.COOKIE_DURATION.total_seconds())
+    value = manager.cookie_codec.encode(
+        user_id,
+        expires=int(time.time()) + expires,
+        generation=manager.get_generation(user_id),
+    )
+    path = manager.config.COOKIE_PATH
+    domain = manager.config.COOKIE_DOMAIN
+    secure = manager.config.COOKIE_SECURE
+    httponly = manager.config.COOKIE_HTTPONLY
+    samesite = manager.config.COOKIE_SAMESITE
+
+    message.setdefault("headers", [])
+    headers = MutableHeaders(scope=message)
+    cookie: "http.cookies.BaseCookie[str]" = http.cookies.SimpleCookie()
+
+    cookie[key] = value
+    if expires is not None:
+        cookie[key]["expires"] = expires
+    if path is not None:
+        cookie[key]["path"] = path
+    if domain is not None:
+        cookie[key]["domain"] = domain
+    if secure:
+        cookie[key]["secure"] = True
+    if httponly:
+        cookie[key]["httponly"] = True
+    if samesite is not None:
+        assert samesite.lower() in [
+            "strict",
+            "lax",
+            "none",
+        ], "samesite must be either 'strict', 'lax' or 'none'"
+        cookie[key]["samesite"] = samesite
+
+    headers["set-cookie"] = cookie.output(header="").strip()
+    return message
+
+
+def best(func: t.Callable[[], t.Any]) -> float:
+    return min(timeit.repeat(func, number=NUMBER, repeat=5)) / NUMBER
+
+
+def main() -> None:
+    config = Config(
+        COOKIE_DOMAIN="example.com", COOKIE_SECURE=True, COOKIE_SAMESITE="lax"
+    )
+    manager = LoginManager(
+        redirect_to="/login", secret_key="benchmark", config=config
+    )
+
+    def response_start() -> Message:
+        return {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/html; charset=utf-8")],
+        }
+
+    codec = best(lambda: manager.cookie_codec.encode(1, expires=1))
+    before = best(
+        lambda: simple_cookie_set_cookie(manager, response_start(), 1)
+    )
+    after = best(lambda: manager.set_cookie(response_start(), 1))
+
+    print(f"cookie value signing       {codec * 1e6:8.2f} us")
+    print(f"SimpleCookie set_cookie    {before * 1e6:8.2f} us")
+    print(f"CookieTemplate set_cookie  {after * 1e6:8.2f} us")
+    print(
+        f"header rendering speedup   "
+        f"{(before - codec) / (after - codec):8.2f} x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""Offline load harness, simulated users sending concurrent requests to an
+in-process application through ASGI.
+
+    python -m benchmarks.load --users 5000 --requests 20000 --concurrency 200
+    python -m benchmarks.load --loader sync --latency 0.005 --cache
+
+Users have session, remember cookie or no cookies (anonymous) according
+to `--mix`, their cookie jar is updated from the `Set-Cookie` responses.
+The user loader simulates a database answering after `--latency` seconds.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import typing as t
+from base64 import b64encode
+
+import itsdangerous
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.types import ASGIApp, Message
+
+from starlette_login.backends import SessionAuthBackend
+from starlette_login.cache import UserCache
+from starlette_login.decorator import login_required
+from starlette_login.loader import LoaderExecutor, SingleFlight
+from starlette_login.login_manager import LoginManager
+from starlette_login.middleware import AuthenticationMiddleware
+
+from .common import USERS, receive
+
+SECRET_KEY = "benchmark"
+SESSION_COOKIE = "session"
+KINDS = ("session", "remember", "anonymous")
+LOADERS = ("async", "sync", "executor", "batch")
+PERCENTILES = (50, 90, 99)
+
+
+class SimulatedDatabase:
+    """User table answering after `latency` seconds, plus a random `jitter`
+    of up to `jitter` seconds.
+    """
+
+    def __init__(
+        self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.queries = 0
+        self.rows = 0
+
+    def delay(self) -> float:
+        self.queries += 1
+        if self.jitter:
+            return self.latency + self.random.uniform(0, self.jitter)
+        return self.latency
+
+    def load_user(self, conn: HTTPConnection, user_id: t.Any) -> t.Any:
+        """Blocking query, e.g. a sync ORM"""
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        self.rows += 1
+        return USERS.get(int(user_id))
+
+    async def async_load_user(
+        self, conn: HTTPConnection, user_id: t.Any
+    ) -> t.Any:
+        delay = self.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        self.rows += 1
+        return USERS.get(int(user_id))
+
+    async def load_users(
+        self, conn: HTTPConnection, user_ids: t.List[t.Any]
+    ) -> t.Dict[t.Any, t.Any]:
+        """Batch query, `SELECT ... WHERE id IN (...)`"""
+        delay = self.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        self.rows += len(user_ids)
+        return {user_id: USERS.get(int(user_id)) for user_id in user_ids}
+
+
+async def home_page(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(f"Hello {request.user.display_name}")
+
+
+@login_required
+async def protected_page(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(f"Protected {request.user.display_name}")
+
+
+def create_app(manager: LoginManager) -> Starlette:
+    app = Starlette(
+        routes=[
+            Route("/", home_page, name="home"),
+            Route("/login", home_page, name="login"),
+            Route("/protected", protected_page, name="protected"),
+        ],
+        middleware=[
+            Middleware(SessionMiddleware, secret_key=SECRET_KEY),
+            Middleware(
+                AuthenticationMiddleware,
+                backend=SessionAuthBackend(manager),
+                login_manager=manager,
+            ),
+        ],
+    )
+    app.state.login_manager = manager
+    return app
+
+
+def create_login_manager(
+    database: SimulatedDatabase,
+    loader: str = "async",
+    cache: bool = False,
+    single_flight: bool = False,
+    executor_workers: int = 4,
+    batch_window: float = 0.0,
+) -> LoginManager:
+    assert loader in LOADERS, f"loader must be one of {LOADERS}"
+    manager = LoginManager(redirect_to="login", secret_key=SECRET_KEY)
+    if loader == "async":
+        manager.set_user_loader(database.async_load_user)
+    elif loader == "batch":
+        manager.set_batch_user_loader(database.load_users, window=batch_window)
+    else:
+        manager.set_user_loader(database.load_user)
+        if loader == "executor":
+            manager.set_loader_executor(LoaderExecutor(executor_workers))
+    if cache:
+        manager.set_user_cache(UserCache(maxsize=len(USERS), ttl=60))
+    if single_flight:
+        manager.set_single_flight(SingleFlight())
+    return manager
+
+
+class Client:
+    """Simulated user agent with its cookie jar"""
+
+    def __init__(self, kind: str, user_id: int, address: str):
+        self.kind = kind
+        self.user_id = user_id
+        self.address = address
+        self.user_agent = f"LoadClient/1.0 ({user_id})".encode()
+        self.cookies: t.Dict[str, str] = {}
+
+    def headers(self) -> t.List[t.Tuple[bytes, bytes]]:
+        headers = [(b"host", b"testserver"), (b"user-agent", self.user_agent)]
+        if self.cookies:
+            cookie = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+            headers.append((b"cookie", cookie.encode("latin-1")))
+        return headers
+
+    def update_cookies(self, message: Message) -> None:
+        for key, value in message.get("headers", ()):
+            if key != b"set-cookie":
+                continue
+            header = value.decode("latin-1")
+            name, _, rest = header.partition("=")
+            cookie_value = rest.split(";", 1)[0]
+            lower = header.lower()
+            if "max-age=0" in lower or "01 jan 1970" in lower:
+                self.cookies.pop(name, None)
+            else:
+                self.cookies[name] = cookie_value
+
+    def scope(self, path: str) -> t.Dict[str, t.Any]:
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.4"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("testserver", 80),
+            "client": (self.address, 50000),
+            "root_path": "",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "headers": self.headers(),
+        }
+
+
+def parse_mix(value: str) -> t.Dict[str, float]:
+    """`session=0.7,remember=0.2,anonymous=0.1`"""
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        assert kind.strip() in KINDS, f"mix kinds are {KINDS}"
+        mix[kind.strip()] = float(weight)
+    assert sum(mix.values()) > 0, "mix weights must not be all 0"
+    return mix
+
+
+def create_clients(
+    manager: LoginManager,
+    count: int,
+    mix: t.Mapping[str, float],
+    rng: random.Random,
+) -> t.List[Client]:
+    assert count <= len(USERS), f"at most {len(USERS)} users"
+    signer = itsdangerous.TimestampSigner(SECRET_KEY)
+    config = manager.config
+    expires = int(time.time()) + int(config.COOKIE_DURATION.total_seconds())
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+
+    clients = []
+    for user_id, kind in enumerate(kinds, start=1):
+        client = Client(
+            kind,
+            user_id,
+            f"10.{user_id >> 16}.{user_id >> 8 & 255}" f".{user_id & 255}",
+        )
+        if kind == "session":
+            conn = HTTPConnection(client.scope("/"))
+            session = {
+                config.SESSION_NAME_KEY: user_id,
+                config.SESSION_NAME_FRESH: True,
+                config.SESSION_NAME_ID: manager.create_identifier(conn),
+            }
+            data = b64encode(json.dumps(session).encode("utf-8"))
+            client.cookies[SESSION_COOKIE] = signer.sign(data).decode()
+        elif kind == "remember":
+            client.cookies[config.COOKIE_NAME] = manager.cookie_codec.encode(
+                user_id, expires=expires
+            )
+        clients.append(client)
+    return clients
+
+
+class Results:
+    def __init__(self) -> None:
+        self.latencies: t.Dict[str, t.List[float]] = {
+            kind: [] for kind in KINDS
+        }
+        self.statuses: t.Dict[int, int] = {}
+        self.elapsed = 0.0
+
+    def add(self, kind: str, status: int, latency: float) -> None:
+        self.latencies[kind].append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def summary(self) -> t.Dict[str, t.Any]:
+        rows = dict(self.latencies)
+        rows["all"] = [v for values in self.latencies.values() for v in values]
+        total = len(rows["all"])
+        return {
+            "requests": total,
+            "elapsed": self.elapsed,
+            "throughput": total / self.elapsed if self.elapsed else 0.0,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "latency": {
+                kind: latency_summary(values)
+                for kind, values in rows.items()
+                if values
+            },
+        }
+
+
+def percentile(values: t.Sequence[float], p: float) -> float:
+    """Nearest rank percentile of sorted `values`"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def latency_summary(values: t.List[float]) -> t.Dict[str, float]:
+    values = sorted(values)
+    summary = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    summary["max"] = values[-1]
+    summary["count"] = len(values)
+    return summary
+
+
+async def request(app: ASGIApp, client: Client, path: str) -> int:
+    status = 0
+
+    async def send(message: Message) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            client.update_cookies(message)
+
+    await app(client.scope(path), receive, send)
+    return status
+
+
+async def run_load(
+    app: ASGIApp,
+    clients: t.Sequence[Client],
+    requests: int,
+    concurrency: int,
+    rng: random.Random,
+) -> Results:
+    results = Results()
+    remaining = requests
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            client = rng.choice(clients)
+            path = "/" if client.kind == "anonymous" else "/protected"
+            start = time.perf_counter()
+            status = await request(app, client, path)
+            results.add(client.kind, status, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    results.elapsed = time.perf_counter() - start
+    return results
+
+
+def loader_stats(
+    manager: LoginManager, database: SimulatedDatabase
+) -> t.Dict[str, t.Any]:
+    stats: t.Dict[str, t.Any] = {
+        "queries": database.queries,
+        "rows": database.rows,
+    }
+    if manager.user_cache is not None:
+        stats["cache"] = dict(manager.user_cache.stats)
+    if manager.single_flight is not None:
+        stats["coalesced"] = manager.single_flight.coalesced
+    if manager.loader_executor is not None:
+        stats["executor"] = dict(manager.loader_executor.stats)
+    return stats
+
+
+def print_report(report: t.Mapping[str, t.Any]) -> None:
+    summary = report["summary"]
+    print(
+        f"{summary['requests']} requests, concurrency "
+        f"{report['options']['concurrency']}, "
+        f"{summary['elapsed']:.2f} s, "
+        f"{summary['throughput']:.0f} req/s"
+    )
+    print(
+        f"{'users':<10} {'requests':>9} "
+        + " ".join(f"{f'p{p} ms':>9}" for p in PERCENTILES)
+        + f" {'max ms':>9}"
+    )
+    for kind, latency in summary["latency"].items():
+        print(
+            f"{kind:<10} {latency['count']:>9} "
+            + " ".join(f"{latency[f'p{p}'] * 1e3:9.2f}" for p in PERCENTILES)
+            + f" {latency['max'] * 1e3:9.2f}"
+        )
+    print(
+        "status "
+        + ", ".join(f"{k}: {v}" for k, v in summary["statuses"].items())
+    )
+    print(
+        "loader " + ", ".join(f"{k}: {v}" for k, v in report["loader"].items())
+    )
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default="session=0.7,remember=0.2,anonymous=0.1",
+        help="weights of the user kinds (default: %(default)s)",
+    )
+    parser.add_argument("--loader", choices=LOADERS, default="async")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.001,
+        help="user loader latency in seconds (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="random extra latency"
+    )
+    parser.add_argument(
+        "--cache", action="store_true", help="set a `UserCache`"
+    )
+    parser.add_argument(
+        "--single-flight", action="store_true", help="set a `SingleFlight`"
+    )
+    parser.add_argument("--executor-workers", type=int, default=4)
+    parser.add_argument("--batch-window", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--json", metavar="PATH", help="write the report, `-` for stdout"
+    )
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    database = SimulatedDatabase(args.latency, args.jitter, args.seed)
+    manager = create_login_manager(
+        database,
+        args.loader,
+        cache=args.cache,
+        single_flight=args.single_flight,
+        executor_workers=args.executor_workers,
+        batch_window=args.batch_window,
+    )
+    app = create_app(manager)
+    clients = create_clients(manager, args.users, args.mix, rng)
+    results = asyncio.run(
+        run_load(app, clients, args.requests, args.concurrency, rng)
+    )
+    if manager.loader_executor is not None:
+        manager.loader_executor.shutdown()
+
+    report = {
+        "options": {
+            key: value for key, value in vars(args).items() if key != "json"
+        },
+        "summary": results.summary(),
+        "loader": loader_stats(manager, database),
+    }
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
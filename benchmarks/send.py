@@ -0,0 +1,76 @@
+"""Per-message overhead of `AuthenticationMiddleware` on streaming
+responses and websocket messages.
+
+    python -m benchmarks.send
+"""
+
+import typing as t
+
+from starlette.responses import StreamingResponse
+from starlette.types import Message, Receive, Scope, Send
+
+from .common import call, create_login_manager, http_scope, timeit, wrap
+
+CHUNKS = 10000
+FRAMES = 10000
+
+
+async def streaming_app(scope: Scope, receive: Receive, send: Send) -> None:
+    async def chunks() -> t.AsyncIterator[bytes]:
+        for _ in range(CHUNKS):
+            yield b"x" * 64
+
+    await StreamingResponse(chunks())(scope, receive, send)
+
+
+async def websocket_app(scope: Scope, receive: Receive, send: Send) -> None:
+    await send({"type": "websocket.accept"})
+    for _ in range(FRAMES):
+        await send({"type": "websocket.send", "text": "ping"})
+    await send({"type": "websocket.close", "code": 1000})
+
+
+async def ws_receive() -> Message:
+    return {"type": "websocket.connect"}  # pragma: no cover
+
+
+async def ws_send(message: Message) -> None:
+    pass
+
+
+def main() -> None:
+    manager = create_login_manager()
+    session = {"_user_id": 1, "_fresh": True, "_remember": "set"}
+    scope = http_scope(session=session)
+    ws_scope = dict(scope, type="websocket", scheme="ws")
+
+    streaming = wrap(streaming_app, manager)
+    websocket = wrap(websocket_app, manager)
+
+    async def ws_call(app: t.Any) -> None:
+        await app(dict(ws_scope, session=dict(session)), ws_receive, ws_send)
+
+    results = [
+        (
+            f"StreamingResponse, {CHUNKS} chunks",
+            timeit(lambda: call(streaming_app, scope), 5),
+            timeit(lambda: call(streaming, scope), 5),
+            CHUNKS,
+        ),
+        (
+            f"websocket, {FRAMES} messages",
+            timeit(lambda: ws_call(websocket_app), 5),
+            timeit(lambda: ws_call(websocket), 5),
+            FRAMES,
+        ),
+    ]
+    for name, bare, wrapped, messages in results:
+        print(
+            f"{name:<36} bare {bare * 1e3:8.2f} ms  "
+            f"middleware {wrapped * 1e3:8.2f} ms  "
+            f"overhead {(wrapped - bare) / messages * 1e9:8.1f} ns/message"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""Benchmark suite of the request hot paths, driving the ASGI application
+directly without HTTP.
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --json baseline.json
+    python -m benchmarks.suite --compare baseline.json --threshold 0.1
+
+`--compare` exits with status `1` when a benchmark is slower than the
+baseline by more than `--threshold`.
+"""
+
+import argparse
+import fnmatch
+import json
+import platform
+import sys
+import time
+import typing as t
+
+from starlette.datastructures import State
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import PlainTextResponse
+from starlette.types import Receive, Scope, Send
+from starlette.websockets import WebSocket
+
+from starlette_login import __version__
+from starlette_login.decorator import (
+    fresh_login_required,
+    login_required,
+    public,
+    ws_login_required,
+)
+from starlette_login.login_manager import Config, ProtectionLevel
+from starlette_login.utils import (
+    _fingerprint,
+    build_next_url,
+    create_identifier,
+    decode_cookie,
+    encode_cookie,
+    make_next_url,
+    split_redirect_url,
+)
+
+from .common import (
+    USERS,
+    call,
+    create_login_manager,
+    http_scope,
+    receive,
+    send,
+    timeit,
+    wrap,
+)
+
+FORMAT_VERSION = 1
+USER_AGENT = (
+    b"Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    b"(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+)
+SECRET_KEY = "benchmark"
+
+
+class Case(t.NamedTuple):
+    name: str
+    func: t.Callable[[], t.Any]
+    number: int
+    # `func` returns an awaitable
+    is_async: bool = False
+
+
+async def endpoint(scope: Scope, receive: Receive, send: Send) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+        }
+    )
+    await send({"type": "http.response.body", "body": b"OK"})
+
+
+def middleware_cases(number: int) -> t.List[Case]:
+    manager = create_login_manager()
+    strong_manager = create_login_manager(
+        Config(protection_level=ProtectionLevel.Strong)
+    )
+    headers = [(b"user-agent", USER_AGENT)]
+    identifier = manager.create_identifier(
+        HTTPConnection(http_scope(headers=headers))
+    )
+    cookie = manager.cookie_codec.encode(
+        1, expires=int(time.time()) + 365 * 86400
+    )
+    session = {"_user_id": 1, "_fresh": True, "_id": identifier}
+
+    anonymous = http_scope(headers=headers)
+    authenticated = http_scope(session=session, headers=headers)
+    remember = http_scope(
+        headers=headers
+        + [(b"cookie", f"remember_token={cookie}".encode("latin-1"))]
+    )
+    # Identifier mismatch, the session is cleared
+    strong = http_scope(
+        session=dict(session, _id="changed", _remember="set"),
+        headers=headers,
+    )
+
+    app = wrap(endpoint, manager)
+    strong_app = wrap(endpoint, strong_manager)
+    return [
+        Case(
+            "middleware.anonymous",
+            lambda: call(app, anonymous),
+            number,
+            True,
+        ),
+        Case(
+            "middleware.session",
+            lambda: call(app, authenticated),
+            number,
+            True,
+        ),
+        Case(
+            "middleware.remember_cookie",
+            lambda: call(app, remember),
+            number,
+            True,
+        ),
+        Case(
+            "middleware.strong_protection",
+            lambda: call(strong_app, strong),
+            number,
+            True,
+        ),
+    ]
+
+
+def codec_cases(number: int) -> t.List[Case]:
+    manager = create_login_manager()
+    legacy_cookie = encode_cookie(1, SECRET_KEY)
+    cookie = manager.cookie_codec.encode(1, expires=2**31)
+    conn = HTTPConnection(http_scope(headers=[(b"user-agent", USER_AGENT)]))
+    parts = split_redirect_url("/login")
+    scope = http_scope("/protected")
+    next_url = "http://testserver/protected?page=2"
+    return [
+        Case(
+            "codec.encode_cookie",
+            lambda: encode_cookie(1, SECRET_KEY),
+            number,
+        ),
+        Case(
+            "codec.decode_cookie",
+            lambda: decode_cookie(legacy_cookie, SECRET_KEY),
+            number,
+        ),
+        Case(
+            "codec.CookieCodec.encode",
+            lambda: manager.cookie_codec.encode(1, expires=2**31),
+            number,
+        ),
+        Case(
+            "codec.CookieCodec.decode",
+            lambda: manager.cookie_codec.decode(cookie),
+            number,
+        ),
+        Case(
+            "utils.create_identifier",
+            lambda: create_identifier(conn),
+            number,
+        ),
+        Case(
+            # Not memoized
+            "utils.create_identifier.uncached",
+            lambda: _fingerprint.__wrapped__(  # type: ignore[attr-defined]
+                "127.0.0.1", USER_AGENT.decode(), "sha512", None
+            ),
+            number,
+        ),
+        Case(
+            "utils.make_next_url",
+            lambda: make_next_url("/login", next_url),
+            number,
+        ),
+        Case(
+            "utils.build_next_url",
+            lambda: build_next_url(parts, scope),
+            number,
+        ),
+    ]
+
+
+def decorator_cases(number: int) -> t.List[Case]:
+    manager = create_login_manager()
+    response = PlainTextResponse("OK")
+    application = type("App", (), {"state": State()})()
+    application.state.login_manager = manager
+    user = USERS[1]
+    anonymous = manager.anonymous_user
+
+    def scope(user: t.Any, **session: t.Any) -> Scope:
+        return dict(
+            http_scope("/protected", session=session),
+            app=application,
+            user=user,
+        )
+
+    fresh = scope(user, _fresh=True)
+    not_fresh = scope(user, _fresh=False)
+    anonymous_scope = scope(anonymous)
+    ws_scope = dict(fresh, type="websocket", scheme="ws")
+
+    async def view(request: Request) -> PlainTextResponse:
+        return response
+
+    async def ws_endpoint(websocket: WebSocket) -> None:
+        pass
+
+    login_view = login_required(view)
+    fresh_view = fresh_login_required(view)
+    public_view = public(view)
+    ws_view = ws_login_required(ws_endpoint)
+
+    def request(scope: Scope) -> Request:
+        return Request(dict(scope, session=dict(scope["session"])), receive)
+
+    return [
+        Case(
+            "decorator.public",
+            lambda: public_view(request(fresh)),
+            number,
+            True,
+        ),
+        Case(
+            "decorator.login_required",
+            lambda: login_view(request(fresh)),
+            number,
+            True,
+        ),
+        Case(
+            "decorator.login_required.redirect",
+            lambda: login_view(request(anonymous_scope)),
+            number,
+            True,
+        ),
+        Case(
+            "decorator.fresh_login_required",
+            lambda: fresh_view(request(fresh)),
+            number,
+            True,
+        ),
+        Case(
+            "decorator.fresh_login_required.redirect",
+            lambda: fresh_view(request(not_fresh)),
+            number,
+            True,
+        ),
+        Case(
+            "decorator.ws_login_required",
+            lambda: ws_view(WebSocket(dict(ws_scope), receive, send)),
+            number,
+            True,
+        ),
+    ]
+
+
+def get_cases(quick: bool = False) -> t.List[Case]:
+    scale = 10 if quick else 1
+    return (
+        middleware_cases(5000 // scale)
+        + codec_cases(20000 // scale)
+        + decorator_cases(10000 // scale)
+    )
+
+
+def measure(case: Case, repeat: int) -> float:
+    """Best mean time of a call of the case, in seconds"""
+    if case.is_async:
+        return timeit(case.func, case.number, repeat)
+
+    func = case.func
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(case.number):
+            func()
+        best = min(best, (time.perf_counter() - start) / case.number)
+    return best
+
+
+def run(
+    cases: t.Sequence[Case], repeat: int, verbose: bool = True
+) -> t.Dict[str, t.Any]:
+    results = {}
+    for case in cases:
+        seconds = measure(case, repeat)
+        results[case.name] = {
+            "seconds": seconds,
+            "number": case.number,
+            "repeat": repeat,
+        }
+        if verbose:
+            print(f"{case.name:<44} {seconds * 1e6:10.2f} us", file=sys.stderr)
+    return {
+        "version": FORMAT_VERSION,
+        "starlette_login": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(
+    baseline: t.Mapping[str, t.Any],
+    current: t.Mapping[str, t.Any],
+    threshold: float,
+) -> t.List[str]:
+    """Print the comparison with `baseline`, return the regressed names"""
+    regressions = []
+    base_results = baseline["results"]
+    print(f"{'benchmark':<44} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current["results"].items():
+        if name not in base_results:
+            print(f"{name:<44} {'-':>10} {result['seconds'] * 1e6:10.2f}")
+            continue
+        before = base_results[name]["seconds"]
+        after = result["seconds"]
+        change = after / before - 1
+        flag = ""
+        if change > threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "improved"
+        print(
+            f"{name:<44} {before * 1e6:10.2f} {after * 1e6:10.2f} "
+            f"{change:+8.1%} {flag}"
+        )
+    return regressions
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.suite", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument(
+        "--json", metavar="PATH", help="write the results, `-` for stdout"
+    )
+    parser.add_argument(
+        "--compare", metavar="BASELINE", help="results of a previous run"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="allowed slowdown ratio against the baseline (default: 0.1)",
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        metavar="PATTERN",
+        help="only run benchmarks matching the glob pattern",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--quick", action="store_true", help="10 times fewer iterations"
+    )
+    args = parser.parse_args(argv)
+
+    cases = get_cases(args.quick)
+    if args.filter:
+        cases = [
+            case for case in cases if fnmatch.fnmatch(case.name, args.filter)
+        ]
+    results = run(cases, args.repeat)
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(
+                f"{len(regressions)} regression(s) above "
+                f"{args.threshold:.0%}: {', '.join(regressions)}"
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,49 +1,159 @@
-import asyncio
+import time
 import typing as t
 
 from starlette.authentication import AuthCredentials, AuthenticationBackend
 from starlette.requests import HTTPConnection
+from starlette.types import Scope
 
+from .codec import RememberToken
 from .login_manager import LoginManager
-from .mixins import AnonymousUser, UserMixin
-from .utils import create_identifier
+from .mixins import AnonymousUser, LazyUser, UserMixin
+from .tracing import (
+    SPAN_COOKIE,
+    SPAN_IDENTIFIER,
+    SPAN_SESSION,
+    TRACE_SCOPE_KEY,
+    AuthTrace,
+)
+from .utils import has_cookie
 
 
 class SessionAuthBackend(AuthenticationBackend):
-    def __init__(self, login_manager: LoginManager):
+    def __init__(self, login_manager: LoginManager, lazy: bool = False):
         self.login_manager = login_manager
+        # Set `scope["user"]` to a `LazyUser`, loaded on first access
+        self.lazy = lazy
 
     async def authenticate(
         self, conn: HTTPConnection
-    ) -> t.Tuple[AuthCredentials, t.Union[AnonymousUser, UserMixin]]:
-        # Load user from session
-        config = self.login_manager.config
+    ) -> t.Tuple[AuthCredentials, t.Union[AnonymousUser, LazyUser, UserMixin]]:
+        user_id = self.get_user_id(conn)
+
+        if user_id is None:
+            return AuthCredentials(), self.login_manager.anonymous_user
+        elif self.lazy:
+            lazy_user = LazyUser(conn, self.login_manager, user_id)
+            return AuthCredentials(["authenticated"]), lazy_user
+        user = await self.login_manager.load_user(conn, user_id)
+        if user is None:
+            # Unknown user or `CircuitBreaker` anonymous fallback
+            return AuthCredentials(), self.login_manager.anonymous_user
+        return AuthCredentials(["authenticated"]), user
+
+    def is_anonymous(self, scope: Scope) -> bool:
+        """Request without session data nor remember cookie"""
+        return (
+            "session" in scope
+            and not scope["session"]
+            and not has_cookie(
+                scope, self.login_manager.config.COOKIE_NAME.encode("latin-1")
+            )
+        )
+
+    def get_user_id(self, conn: HTTPConnection) -> t.Any:
+        if self.is_anonymous(conn.scope):
+            return None
+
+        trace = conn.scope.get(TRACE_SCOPE_KEY)
+        if trace is None:
+            return self._get_user_id(conn, None)
+        span = trace.start(SPAN_SESSION)
+        try:
+            return self._get_user_id(conn, trace)
+        finally:
+            trace.end(span)
+
+    def _get_user_id(
+        self, conn: HTTPConnection, trace: t.Optional[AuthTrace]
+    ) -> t.Any:
+        # Load user id from session
+        plan = self.login_manager.get_plan()
+        config = plan.config
         remember_cookie = config.REMEMBER_COOKIE_NAME
         session_fresh = config.SESSION_NAME_FRESH
 
+        metrics = self.login_manager.metrics
         session = conn.session.get(config.SESSION_NAME_ID)
-        identifier = create_identifier(conn)
+        if trace is not None:
+            span = trace.start(SPAN_IDENTIFIER)
+        start = 0.0 if metrics is None else time.perf_counter()
+        try:
+            identifier = self.login_manager.create_identifier(conn)
+        finally:
+            if metrics is not None:
+                metrics.fingerprint_seconds.observe(
+                    time.perf_counter() - start
+                )
+            if trace is not None:
+                trace.end(span)
 
+        update_session = self.login_manager.update_session
         if identifier != session:
-            if self.login_manager.protection_is_strong():
+            if self.login_manager.is_legacy_identifier(conn, session):
+                # Upgrade identifier created with the previous algorithm
+                update_session(
+                    conn.session, config.SESSION_NAME_ID, identifier
+                )
+            elif plan.protection_is_strong:
                 # Strong protection
-                for key in config.session_keys:
+                for key in plan.session_keys:
                     conn.session.pop(key, None)
-                conn.session[remember_cookie] = "clear"
+                update_session(conn.session, remember_cookie, "clear")
+                if metrics is not None:
+                    metrics.strong_protection_wipes.inc()
             else:
-                conn.session[session_fresh] = False
+                update_session(conn.session, session_fresh, False)
         user_id = conn.session.get(config.SESSION_NAME_KEY)
+        if (
+            user_id is not None
+            and self.login_manager.generation_store is not None
+            and conn.session.get(config.SESSION_NAME_GENERATION, 0)
+            != self.login_manager.get_generation(user_id)
+        ):
+            # Session revoked by `LoginManager.logout_all`
+            for key in plan.session_keys:
+                conn.session.pop(key, None)
+            update_session(conn.session, remember_cookie, "clear")
+            user_id = None
 
         if user_id is None and conn.session.get(remember_cookie) != "clear":
             cookie = conn.cookies.get(config.COOKIE_NAME)
             if cookie:
-                user_id = self.login_manager.get_cookie(cookie)
-                conn.session[session_fresh] = False
+                if trace is not None:
+                    span = trace.start(SPAN_COOKIE)
+                start = 0.0 if metrics is None else time.perf_counter()
+                try:
+                    token = self.login_manager.get_cookie_token(cookie)
+                finally:
+                    if metrics is not None:
+                        metrics.cookie_decode_seconds.observe(
+                            time.perf_counter() - start
+                        )
+                    if trace is not None:
+                        trace.end(span)
+                if metrics is not None and token is not None:
+                    metrics.remember_restored.inc()
+                update_session(conn.session, session_fresh, False)
+                if token is not None:
+                    user_id = token.user_id
+                    self.restore_remember(conn.session, token)
+        return user_id
 
-        if user_id is None:
-            return AuthCredentials(), self.login_manager.anonymous_user_cls()
-        elif asyncio.iscoroutinefunction(self.login_manager.user_loader):
-            user = await self.login_manager.user_loader(conn, user_id)
-        else:
-            user = self.login_manager.user_loader(conn, user_id)
-        return AuthCredentials(["authenticated"]), user
+    def restore_remember(
+        self, session: t.MutableMapping[str, t.Any], token: RememberToken
+    ) -> None:
+        """Keep the sliding refresh of the remember cookie restoring the
+        session, with the duration and issue time of the cookie.
+        """
+        if not token.expires or not token.duration:
+            # Unknown duration, e.g. version 1 cookies, not refreshed
+            return
+        config = self.login_manager.config
+        update_session = self.login_manager.update_session
+        update_session(session, config.REMEMBER_COOKIE_NAME, "set")
+        update_session(session, config.REMEMBER_SECONDS_NAME, token.duration)
+        update_session(
+            session,
+            config.REMEMBER_ISSUED_NAME,
+            token.expires - token.duration,
+        )
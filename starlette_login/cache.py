@@ -0,0 +1,117 @@
+import time
+import typing as t
+from collections import OrderedDict
+from datetime import timedelta
+
+EVICTION_LRU = "lru"
+EVICTION_FIFO = "fifo"
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded in-memory cache with per-entry time to live.
+
+    When the cache is full, the least recently used (``"lru"``) or the
+    oldest inserted (``"fifo"``) entry is evicted.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: t.Optional[t.Union[float, timedelta]] = None,
+        eviction: str = EVICTION_LRU,
+        timer: t.Callable[[], float] = time.monotonic,
+    ):
+        assert maxsize > 0, "maxsize must be greater than 0"
+        assert eviction in (
+            EVICTION_LRU,
+            EVICTION_FIFO,
+        ), "eviction must be either 'lru' or 'fifo'"
+        if isinstance(ttl, timedelta):
+            ttl = ttl.total_seconds()
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.eviction = eviction
+        self.timer = timer
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[t.Hashable, t.Tuple[t.Any, float]]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: t.Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(
+        self, key: t.Hashable, default: t.Any = None, count: bool = True
+    ) -> t.Any:
+        item = self._data.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at and expires_at <= self.timer():
+                del self._data[key]
+            else:
+                if self.eviction == EVICTION_LRU:
+                    self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+        if count:
+            self.misses += 1
+        return default
+
+    def set(
+        self, key: t.Hashable, value: t.Any, ttl: t.Optional[float] = None
+    ) -> None:
+        """Set `value`, `ttl` overrides the time to live of the cache"""
+        if ttl is None:
+            ttl = self.ttl
+        expires_at = self.timer() + ttl if ttl else 0.0
+        if key in self._data:
+            del self._data[key]
+        elif len(self._data) >= self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        self._data[key] = (value, expires_at)
+
+    def pop(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        return item[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def stats(self) -> t.Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+        }
+
+
+class UserCache(TTLCache):
+    """Cache of loaded users keyed by their identity.
+
+    Identities are normalized to ``str`` since the same user id may come
+    from the session (JSON value) or from the remember cookie (string).
+    """
+
+    def get_user(self, user_id: t.Any) -> t.Any:
+        return self.get(str(user_id))
+
+    def set_user(self, user_id: t.Any, user: t.Any) -> None:
+        self.set(str(user_id), user)
+
+    def invalidate(self, user_id: t.Any) -> None:
+        self.pop(str(user_id))
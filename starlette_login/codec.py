@@ -0,0 +1,214 @@
+import hmac
+import http.cookies
+import typing as t
+from base64 import urlsafe_b64encode
+from email.utils import formatdate
+from hashlib import sha256
+
+from starlette.types import Message
+
+from .utils import _decode_cookie, _encode_cookie, _secret_key, cookie_hmac
+
+COOKIE_VERSION = "2"
+COOKIE_DIGESTS = ("sha256", "sha512", "blake2b")
+# Shortest truncated digest, in bytes
+MIN_DIGEST_SIZE = 8
+
+
+class RememberToken(t.NamedTuple):
+    user_id: str
+    # Expiry unix timestamp, user session generation and cookie duration
+    # in seconds, `None` for cookies of the version 1 format
+    expires: t.Optional[int] = None
+    generation: t.Optional[int] = None
+    duration: t.Optional[int] = None
+
+
+def _b64encode(data: bytes) -> str:
+    return urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def key_id(key: t.Union[bytes, str]) -> str:
+    """Short, stable identifier of a secret key"""
+    return _b64encode(sha256(_secret_key(key)).digest()[:3])
+
+
+class CookieCodec:
+    """Signed remember cookie value encoder/decoder.
+
+    Cookies are formatted as
+    `2.<key id>.<expires>.<duration>.<generation>.<payload>.<digest>`
+    where the digest is a base64url HMAC of everything before it,
+    optionally truncated to `digest_size` bytes.
+
+    The first of `secret_keys` signs new cookies, the other keys are
+    still accepted so that secrets can be rotated. The key id selects the
+    verification key directly. Cookies of the `payload|<sha512 hex>`
+    format (version 1) are still decoded.
+    """
+
+    def __init__(
+        self,
+        secret_keys: t.Sequence[t.Union[bytes, str]],
+        digest: str = "sha256",
+        digest_size: t.Optional[int] = 16,
+        version: int = 2,
+    ):
+        assert secret_keys, "at least one secret key is required"
+        assert (
+            digest in COOKIE_DIGESTS
+        ), f"digest must be one of {COOKIE_DIGESTS}"
+        assert version in (1, 2), "version must be either 1 or 2"
+        self.digest_size = digest_size
+        self.version = version
+
+        self._macs: t.Dict[str, "hmac.HMAC"] = {}
+        for key in secret_keys:
+            self._macs.setdefault(
+                key_id(key), hmac.new(_secret_key(key), digestmod=digest)
+            )
+        full_size = next(iter(self._macs.values())).digest_size
+        assert digest_size is None or (
+            MIN_DIGEST_SIZE <= digest_size <= full_size
+        ), f"digest_size must be between {MIN_DIGEST_SIZE} and {full_size}"
+        self.key_id = key_id(secret_keys[0])
+        self._legacy_macs = [cookie_hmac(key) for key in secret_keys]
+
+    def encode(
+        self,
+        payload: t.Any,
+        expires: int = 0,
+        generation: int = 0,
+        duration: int = 0,
+    ) -> str:
+        """Sign `payload`, `expires` is a unix timestamp, `0` for never.
+        `duration` is the cookie lifetime in seconds, `0` if unknown.
+        """
+        if self.version == 1:
+            return _encode_cookie(payload, self._legacy_macs[0])
+
+        message = (
+            f"{COOKIE_VERSION}.{self.key_id}.{expires}.{duration}."
+            f"{generation}.{payload}"
+        )
+        return f"{message}.{self._digest(self._macs[self.key_id], message)}"
+
+    def decode(self, cookie: str) -> t.Optional[str]:
+        token = self.decode_token(cookie)
+        return None if token is None else token.user_id
+
+    def decode_token(self, cookie: str) -> t.Optional[RememberToken]:
+        if cookie.startswith(COOKIE_VERSION + "."):
+            token = self._decode(cookie)
+            if token is not None:
+                return token
+
+        for mac in self._legacy_macs:
+            payload = _decode_cookie(cookie, mac)
+            if payload is not None:
+                return RememberToken(payload)
+        return None
+
+    def _decode(self, cookie: str) -> t.Optional[RememberToken]:
+        message, _, digest = cookie.rpartition(".")
+        try:
+            _, kid, expires, duration, generation, payload = message.split(
+                ".", 5
+            )
+        except ValueError:
+            return None
+
+        mac = self._macs.get(kid)
+        if mac is None:
+            return None
+        if hmac.compare_digest(self._digest(mac, message), digest):
+            try:
+                return RememberToken(
+                    payload, int(expires), int(generation), int(duration)
+                )
+            except ValueError:  # pragma: no cover
+                return None
+        return None
+
+    def _digest(self, mac: "hmac.HMAC", message: str) -> str:
+        mac = mac.copy()
+        mac.update(message.encode("utf-8"))
+        return _b64encode(mac.digest()[: self.digest_size])
+
+
+class CookieTemplate:
+    """Pre-rendered `Set-Cookie` header of the remember cookie.
+
+    Cookie attributes are validated and rendered once, only the value and
+    the expiry date (cached per second) are formatted per response. The
+    header is the same as `http.cookies.SimpleCookie` output.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: t.Optional[str] = "/",
+        domain: t.Optional[str] = None,
+        secure: bool = False,
+        httponly: bool = True,
+        samesite: t.Optional[str] = None,
+    ):
+        if samesite is not None:
+            assert samesite.lower() in [
+                "strict",
+                "lax",
+                "none",
+            ], "samesite must be either 'strict', 'lax' or 'none'"
+        # Raises `http.cookies.CookieError` on an invalid cookie name
+        self._cookie: "http.cookies.BaseCookie[str]" = (
+            http.cookies.SimpleCookie()
+        )
+        self._cookie[name] = ""
+        self.name = name
+
+        # Attributes sorted by name, as `SimpleCookie` does
+        domain_attr = f"; Domain={domain}" if domain is not None else ""
+        path_attr = f"; Path={path}" if path is not None else ""
+        self._before_expires = domain_attr
+        self._after_expires = "".join(
+            (
+                "; HttpOnly" if httponly else "",
+                path_attr,
+                f"; SameSite={samesite}" if samesite is not None else "",
+                "; Secure" if secure else "",
+            )
+        )
+        self.clear_header = (
+            f'{name}=""{domain_attr}; '
+            "expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+            f"Max-Age=0{path_attr}"
+        ).encode("latin-1")
+        self._expires: t.Tuple[int, str] = (0, "")
+
+    def expires_date(self, timestamp: int) -> str:
+        if self._expires[0] != timestamp:
+            self._expires = (timestamp, formatdate(timestamp, usegmt=True))
+        return self._expires[1]
+
+    def render(self, value: str, expires: int) -> bytes:
+        _, coded = self._cookie.value_encode(value)
+        return (
+            f"{self.name}={coded}{self._before_expires}; "
+            f"expires={self.expires_date(expires)}{self._after_expires}"
+        ).encode("latin-1")
+
+    def set(self, message: Message, value: str, expires: int) -> Message:
+        """Append the cookie to the `http.response.start` message"""
+        return self._append(message, self.render(value, expires))
+
+    def clear(self, message: Message) -> Message:
+        """Append the cookie deletion to the `http.response.start` message"""
+        return self._append(message, self.clear_header)
+
+    @staticmethod
+    def _append(message: Message, header: bytes) -> Message:
+        headers = message.setdefault("headers", [])
+        if not isinstance(headers, list):
+            headers = message["headers"] = list(headers)
+        headers.append((b"set-cookie", header))
+        return message
@@ -7,7 +7,8 @@ from starlette.requests import Request
 from starlette.responses import RedirectResponse, Response
 from starlette.websockets import WebSocket
 
-from .utils import create_identifier, make_next_url
+from .mixins import user_is_authenticated
+from .policy import AuthPolicy, set_auth_policy
 
 LOGIN_MANAGER_ERROR = "LoginManager is not set"
 
@@ -39,18 +40,20 @@ def login_required(func: typing.Callable) -> typing.Callable:
             login_manager = getattr(request.app.state, "login_manager", None)
             assert login_manager is not None, LOGIN_MANAGER_ERROR
 
-            if request.method in login_manager.config.EXEMPT_METHODS:
+            plan = login_manager.get_plan()
+            if request.method in plan.exempt_methods:
                 return await func(*args, **kwargs)  # pragma: no cover
 
             user = request.scope.get("user")
-            if not user or getattr(user, "is_authenticated", False) is False:
-                redirect_url = make_next_url(
-                    login_manager.build_redirect_url(request), str(request.url)
-                )
+            if not user_is_authenticated(user):
+                if login_manager.metrics is not None:
+                    login_manager.metrics.redirects.inc()
+                redirect_url = plan.login_redirect_url(request)
                 return RedirectResponse(redirect_url, status_code=302)
             else:
                 return await func(*args, **kwargs)
 
+        set_auth_policy(async_wrapper, AuthPolicy.Login)
         return async_wrapper
     else:
 
@@ -62,18 +65,20 @@ def login_required(func: typing.Callable) -> typing.Callable:
             login_manager = getattr(request.app.state, "login_manager", None)
             assert login_manager is not None, LOGIN_MANAGER_ERROR
 
-            if request.method in login_manager.config.EXEMPT_METHODS:
+            plan = login_manager.get_plan()
+            if request.method in plan.exempt_methods:
                 return func(*args, **kwargs)  # pragma: no cover
 
             user = request.scope.get("user")
-            if not user or getattr(user, "is_authenticated", False) is False:
-                redirect_url = make_next_url(
-                    login_manager.build_redirect_url(request), str(request.url)
-                )
+            if not user_is_authenticated(user):
+                if login_manager.metrics is not None:
+                    login_manager.metrics.redirects.inc()
+                redirect_url = plan.login_redirect_url(request)
                 return RedirectResponse(redirect_url, status_code=302)
             else:
                 return func(*args, **kwargs)
 
+        set_auth_policy(sync_wrapper, AuthPolicy.Login)
         return sync_wrapper
 
 
@@ -89,11 +94,12 @@ def ws_login_required(func: typing.Callable) -> typing.Callable:
         assert login_manager is not None, LOGIN_MANAGER_ERROR
 
         user = websocket.scope.get("user")
-        if not user or getattr(user, "is_authenticated", False) is False:
+        if not user_is_authenticated(user):
             await login_manager.ws_not_authenticated(websocket)
         else:
             return await func(*args, **kwargs)
 
+    set_auth_policy(async_wrapper, AuthPolicy.Login)
     return async_wrapper
 
 
@@ -111,31 +117,33 @@ def fresh_login_required(func: typing.Callable) -> typing.Callable:
             login_manager = getattr(request.app.state, "login_manager", None)
             assert login_manager is not None, LOGIN_MANAGER_ERROR
 
-            if request.method in login_manager.config.EXEMPT_METHODS:
+            plan = login_manager.get_plan()
+            if request.method in plan.exempt_methods:
                 return await func(*args, **kwargs)  # pragma: no cover
 
             session_fresh = login_manager.config.SESSION_NAME_FRESH
 
             user = request.scope.get("user")
             if (
-                not user
-                or getattr(user, "is_authenticated", False) is False
+                not user_is_authenticated(user)
                 or request.session.get(session_fresh, False) is False
             ):
-                request.session[login_manager.config.SESSION_NAME_ID] = (
-                    create_identifier(request)
+                login_manager.update_session(
+                    request.session,
+                    login_manager.config.SESSION_NAME_ID,
+                    login_manager.create_identifier(request),
                 )
 
+                if login_manager.metrics is not None:
+                    login_manager.metrics.redirects.inc()
                 return RedirectResponse(
-                    make_next_url(
-                        login_manager.build_redirect_url(request),
-                        str(request.url),
-                    ),
+                    plan.login_redirect_url(request),
                     status_code=302,
                 )
             else:
                 return await func(*args, **kwargs)
 
+        set_auth_policy(async_wrapper, AuthPolicy.FreshLogin)
         return async_wrapper
     else:
 
@@ -146,29 +154,38 @@ def fresh_login_required(func: typing.Callable) -> typing.Callable:
             login_manager = getattr(request.app.state, "login_manager", None)
             assert login_manager is not None, LOGIN_MANAGER_ERROR
 
-            if request.method in login_manager.config.EXEMPT_METHODS:
+            plan = login_manager.get_plan()
+            if request.method in plan.exempt_methods:
                 return func(*args, **kwargs)  # pragma: no cover
 
             session_fresh = login_manager.config.SESSION_NAME_FRESH
 
             user = request.scope.get("user")
             if (
-                not user
-                or getattr(user, "is_authenticated", False) is False
+                not user_is_authenticated(user)
                 or request.session.get(session_fresh, False) is False
             ):
-                request.session[login_manager.config.SESSION_NAME_ID] = (
-                    create_identifier(request)
+                login_manager.update_session(
+                    request.session,
+                    login_manager.config.SESSION_NAME_ID,
+                    login_manager.create_identifier(request),
                 )
 
+                if login_manager.metrics is not None:
+                    login_manager.metrics.redirects.inc()
                 return RedirectResponse(
-                    make_next_url(
-                        login_manager.build_redirect_url(request),
-                        str(request.url),
-                    ),
+                    plan.login_redirect_url(request),
                     status_code=302,
                 )
             else:
                 return func(*args, **kwargs)
 
+        set_auth_policy(sync_wrapper, AuthPolicy.FreshLogin)
         return sync_wrapper
+
+
+def public(func: typing.Callable) -> typing.Callable:
+    """Mark route as public, `AuthenticationMiddleware` with
+    `route_policies=True` skips authentication of the route"""
+    set_auth_policy(func, AuthPolicy.Public)
+    return func
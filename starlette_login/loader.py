@@ -0,0 +1,398 @@
+import asyncio
+import contextvars
+import threading
+import time
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+
+from .cache import UserCache
+
+T = t.TypeVar("T")
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+FALLBACK_STALE = "stale"
+FALLBACK_ANONYMOUS = "anonymous"
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing the same key.
+
+    While a call for a key is in flight, later callers for the same key
+    await the same task instead of starting a new one. Every waiter gets
+    the result or the exception of that task.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: t.Dict[t.Hashable, "asyncio.Future[t.Any]"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(
+        self, key: t.Hashable, func: t.Callable[[], t.Awaitable[T]]
+    ) -> T:
+        future = self._in_flight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(func())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+        else:
+            self.coalesced += 1
+        # Shield the shared task so a cancelled waiter does not cancel
+        # the load for the other waiters.
+        return await asyncio.shield(future)
+
+    def _done(self, key: t.Hashable, future: "asyncio.Future[t.Any]"):
+        self._in_flight.pop(key, None)
+        if not future.cancelled():
+            # Mark the exception as retrieved, waiters may all be gone
+            future.exception()
+
+
+class BatchLoader:
+    """Resolve the keys requested within one event loop tick (or within
+    `window` seconds) with a single call of `batch_fn`.
+
+    `batch_fn(conn, keys)` returns a mapping of key to value, missing keys
+    resolve to `None`. It receives the connection of the first caller.
+    """
+
+    def __init__(
+        self,
+        batch_fn: t.Callable[..., t.Any],
+        window: float = 0.0,
+        max_batch_size: t.Optional[int] = None,
+    ):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._is_async = asyncio.iscoroutinefunction(batch_fn)
+
+        self._pending: t.Dict[str, t.Tuple[t.Any, "asyncio.Future[t.Any]"]] = (
+            {}
+        )
+        self._conn: t.Any = None
+        self._handle: t.Optional[asyncio.Handle] = None
+        self.batches = 0
+        self.loads = 0
+
+    async def load(self, conn: t.Any, key: t.Any) -> t.Any:
+        self.loads += 1
+        pending_key = str(key)
+        if pending_key in self._pending:
+            future = self._pending[pending_key][1]
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            if not self._pending:
+                self._conn = conn
+            self._pending[pending_key] = (key, future)
+
+            if (
+                self.max_batch_size is not None
+                and len(self._pending) >= self.max_batch_size
+            ):
+                self._dispatch()
+            elif self._handle is None:
+                if self.window > 0:
+                    self._handle = loop.call_later(self.window, self._dispatch)
+                else:
+                    self._handle = loop.call_soon(self._dispatch)
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, {}
+        conn, self._conn = self._conn, None
+        if pending:
+            self.batches += 1
+            asyncio.ensure_future(self._run(conn, pending))
+
+    async def _run(
+        self,
+        conn: t.Any,
+        pending: t.Dict[str, t.Tuple[t.Any, "asyncio.Future[t.Any]"]],
+    ) -> None:
+        keys = [key for key, _ in pending.values()]
+        try:
+            if self._is_async:
+                result = await self.batch_fn(conn, keys)
+            else:
+                result = self.batch_fn(conn, keys)
+        except Exception as exc:
+            for _, future in pending.values():
+                if not future.done():
+                    future.set_exception(exc)
+                    # Mark as retrieved, waiters may all be gone
+                    future.exception()
+            return
+
+        for pending_key, (key, future) in pending.items():
+            if not future.done():
+                value = result.get(key)
+                if value is None:
+                    value = result.get(pending_key)
+                future.set_result(value)
+
+
+class LoaderExecutor:
+    """Bounded thread pool running sync loaders off the event loop.
+
+    At most `max_workers` loaders run at once, other calls wait in the
+    executor queue. `queued`, `active` and `peak_queued` expose the
+    current and the highest observed queue depth.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        assert max_workers > 0, "max_workers must be greater than 0"
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="starlette-login"
+        )
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.peak_queued = 0
+        self.completed = 0
+
+    @property
+    def stats(self) -> t.Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "queued": self.queued,
+            "active": self.active,
+            "peak_queued": self.peak_queued,
+            "completed": self.completed,
+        }
+
+    async def run(self, func: t.Callable[..., T], *args: t.Any) -> T:
+        with self._lock:
+            self.queued += 1
+            if self.queued > self.peak_queued:
+                self.peak_queued = self.queued
+
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._call, func, *args)
+        future.add_done_callback(self._cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _cancelled(self, future: "Future[t.Any]") -> None:
+        # Cancelled while waiting in the queue, `_call` never ran
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def _call(self, func: t.Callable[..., T], *args: t.Any) -> T:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+class CircuitBreaker:
+    """Deadline and circuit breaker around `user_loader` calls.
+
+    A call failing or taking longer than `timeout` seconds counts as a
+    failure, after `failure_threshold` consecutive failures the circuit
+    opens and the `user_loader` is not called for `reset_timeout` seconds.
+    Then a single trial call closes the circuit again or keeps it open.
+
+    Timed out and rejected calls, and failed calls opening the circuit,
+    return the last loaded user (``"stale"``) or `None`, an anonymous user
+    (``"anonymous"``). Errors of the `user_loader` are raised again while
+    the circuit stays closed. A sync `user_loader` can not be interrupted,
+    its result is returned but a call over `timeout` counts as a failure.
+    """
+
+    def __init__(
+        self,
+        timeout: t.Optional[float] = None,
+        failure_threshold: int = 5,
+        reset_timeout: t.Union[float, timedelta] = 30.0,
+        fallback: str = FALLBACK_STALE,
+        stale_maxsize: int = 1024,
+        stale_ttl: t.Optional[t.Union[float, timedelta]] = None,
+        timer: t.Callable[[], float] = time.monotonic,
+    ):
+        assert (
+            failure_threshold > 0
+        ), "failure_threshold must be greater than 0"
+        assert fallback in (
+            FALLBACK_STALE,
+            FALLBACK_ANONYMOUS,
+        ), "fallback must be either 'stale' or 'anonymous'"
+        if isinstance(reset_timeout, timedelta):
+            reset_timeout = reset_timeout.total_seconds()
+
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.fallback = fallback
+        self.timer = timer
+        # Last loaded users, served while the circuit is open
+        self.stale: t.Optional[UserCache] = None
+        if fallback == FALLBACK_STALE:
+            self.stale = UserCache(stale_maxsize, stale_ttl, timer=timer)
+
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._listeners: t.List[t.Callable[[str, str], t.Any]] = []
+
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+        self.fallbacks = 0
+        self.last_error: t.Optional[BaseException] = None
+
+    @property
+    def stats(self) -> t.Dict[str, t.Any]:
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "fallbacks": self.fallbacks,
+        }
+
+    def on_state_change(
+        self, callback: t.Callable[[str, str], t.Any]
+    ) -> t.Callable[[str, str], t.Any]:
+        """Call `callback(old_state, new_state)` on state transitions"""
+        self._listeners.append(callback)
+        return callback
+
+    def _set_state(self, state: str) -> None:
+        old_state, self.state = self.state, state
+        if old_state != state:
+            for callback in self._listeners:
+                callback(old_state, state)
+
+    def allow(self) -> bool:
+        """Whether the `user_loader` may be called"""
+        if self.state == BREAKER_CLOSED:
+            return True
+        if self.state == BREAKER_OPEN:
+            if self.timer() - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state(BREAKER_HALF_OPEN)
+        if self._trial:
+            # A trial call is in flight
+            return False
+        self._trial = True
+        return True
+
+    def _update_stale(self, user_id: t.Any, user: t.Any) -> None:
+        if self.stale is not None:
+            if user is None:
+                # Deleted or disabled user, never serve it again
+                self.stale.invalidate(user_id)
+            else:
+                self.stale.set_user(user_id, user)
+
+    def record_success(self, user_id: t.Any, user: t.Any) -> None:
+        self._trial = False
+        self.failures = 0
+        self._update_stale(user_id, user)
+        self._set_state(BREAKER_CLOSED)
+
+    def _record_result(
+        self, user_id: t.Any, user: t.Any, start: float
+    ) -> None:
+        elapsed = self.timer() - start
+        if self.timeout is not None and elapsed > self.timeout:
+            # Loaded past the deadline, e.g. by a sync `user_loader`
+            self.timeouts += 1
+            self.last_error = TimeoutError(f"user_loader took {elapsed:.3f}s")
+            self._update_stale(user_id, user)
+            self.record_failure()
+        else:
+            self.record_success(user_id, user)
+
+    def _record_error(self, exc: Exception) -> None:
+        self.errors += 1
+        self.last_error = exc
+        self.record_failure()
+        if self.state == BREAKER_CLOSED:
+            # Below the threshold, loader errors are not hidden
+            raise exc
+
+    def record_failure(self) -> None:
+        self._trial = False
+        self.failures += 1
+        if (
+            self.state == BREAKER_HALF_OPEN
+            or self.failures >= self.failure_threshold
+        ):
+            self.opened_at = self.timer()
+            self._set_state(BREAKER_OPEN)
+
+    def fallback_user(self, user_id: t.Any) -> t.Any:
+        self.fallbacks += 1
+        if self.stale is None:
+            return None
+        return self.stale.get_user(user_id)
+
+    async def call(
+        self, user_id: t.Any, load: t.Callable[[], t.Awaitable[T]]
+    ) -> t.Any:
+        if not self.allow():
+            self.rejected += 1
+            return self.fallback_user(user_id)
+
+        self.calls += 1
+        start = self.timer()
+        try:
+            if self.timeout is None:
+                user = await load()
+            else:
+                user = await asyncio.wait_for(load(), self.timeout)
+        except asyncio.TimeoutError as exc:
+            self.timeouts += 1
+            self.last_error = exc
+            self.record_failure()
+        except asyncio.CancelledError:
+            self._trial = False
+            raise
+        except Exception as exc:
+            self._record_error(exc)
+        else:
+            self._record_result(user_id, user, start)
+            return user
+        return self.fallback_user(user_id)
+
+    def call_sync(self, user_id: t.Any, load: t.Callable[[], T]) -> t.Any:
+        """Call a sync `load`, a call over `timeout` counts as a failure"""
+        if not self.allow():
+            self.rejected += 1
+            return self.fallback_user(user_id)
+
+        self.calls += 1
+        start = self.timer()
+        try:
+            user = load()
+        except Exception as exc:
+            self._record_error(exc)
+            return self.fallback_user(user_id)
+        self._record_result(user_id, user, start)
+        return user
@@ -1,16 +1,46 @@
-import http.cookies
+import asyncio
+import functools
+import hmac
+import time
 import typing as t
+import weakref
 from dataclasses import dataclass
 from datetime import timedelta
 from enum import Enum
+from hashlib import sha512
 
-from starlette.datastructures import MutableHeaders
+from starlette.datastructures import URLPath
 from starlette.requests import HTTPConnection
-from starlette.types import Message
+from starlette.routing import NoMatchFound
+from starlette.types import Message, Scope
 from starlette.websockets import WebSocket
 
+from .cache import TTLCache, UserCache
+from .codec import CookieCodec, CookieTemplate, RememberToken
+from .loader import BatchLoader, CircuitBreaker, LoaderExecutor, SingleFlight
+from .metrics import AuthMetrics
 from .mixins import AnonymousUser, UserMixin
-from .utils import decode_cookie, encode_cookie
+from .session import GenerationStore
+from .tracing import SPAN_USER_LOADER, get_trace
+from .utils import (
+    IDENTIFIER_ALGORITHMS,
+    IDENTIFIER_SHA512,
+    _secret_key,
+    build_next_url,
+    create_identifier,
+    make_next_url,
+    split_redirect_url,
+)
+
+_MISSING = object()
+
+
+def _host_header(scope: Scope) -> t.Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == b"host":
+            return value
+    return None
+
 
 WebsocketAuthFailCallback = t.Callable[[WebSocket], t.Awaitable[None]]
 
@@ -28,10 +58,17 @@ class Config:
     SESSION_NAME_NEXT: str = "next"
     REMEMBER_COOKIE_NAME: str = "_remember"
     REMEMBER_SECONDS_NAME: str = "_remember_seconds"
+    REMEMBER_ISSUED_NAME: str = "_remember_issued"
+    SESSION_NAME_GENERATION: str = "_generation"
     EXEMPT_METHODS: t.Tuple[str] = ("OPTIONS",)
 
     protection_level: t.Optional[ProtectionLevel] = ProtectionLevel.Basic
 
+    # Session identifier (client fingerprint) configuration
+    IDENTIFIER_ALGORITHM: str = IDENTIFIER_SHA512
+    # Accept `sha512` identifiers of existing sessions when migrating
+    IDENTIFIER_ACCEPT_LEGACY: bool = True
+
     # Cookie configuration
     COOKIE_NAME: str = "remember_token"
     COOKIE_DOMAIN: t.Optional[str] = None
@@ -42,9 +79,22 @@ class Config:
     # COOKIE_SAMESITE: t.Optional[t.Literal["lax", "strict", "none"]] = None
     COOKIE_SAMESITE: t.Optional[str] = None
     COOKIE_DURATION: timedelta = timedelta(days=365)
+    # Reissue the remember cookie once this fraction of its duration has
+    # elapsed, `None` to never refresh it
+    COOKIE_REFRESH_AFTER: t.Optional[float] = 0.5
+    # Remember cookie format, `1` for the `payload|<sha512 hex>` format
+    COOKIE_VERSION: int = 2
+    COOKIE_DIGEST: str = "sha256"
+    # Truncate the digest to this number of bytes, `None` for full digest
+    COOKIE_DIGEST_SIZE: t.Optional[int] = 16
+    # Cache of verified remember cookie values, size `0` to disable
+    COOKIE_CACHE_SIZE: int = 1024
+    COOKIE_CACHE_TTL: timedelta = timedelta(minutes=5)
+    # Cache of login redirect URLs per host, scheme and root path
+    REDIRECT_CACHE_SIZE: int = 256
 
     @property
-    def session_keys(self) -> t.Tuple[str, str, str, str, str, str]:
+    def session_keys(self) -> t.Tuple[str, ...]:
         return (
             self.SESSION_NAME_FRESH,
             self.SESSION_NAME_ID,
@@ -52,29 +102,298 @@ class Config:
             self.SESSION_NAME_NEXT,
             self.REMEMBER_COOKIE_NAME,
             self.REMEMBER_SECONDS_NAME,
+            self.REMEMBER_ISSUED_NAME,
+            self.SESSION_NAME_GENERATION,
+        )
+
+
+LOADER_BATCH = "batch"
+LOADER_ASYNC = "async"
+LOADER_EXECUTOR = "executor"
+LOADER_SYNC = "sync"
+
+
+class RuntimePlan:
+    """Immutable snapshot of a `LoginManager` and its `Config`, with the
+    values derived on every request precomputed.
+
+    Created by `LoginManager.compile`, changes to the login manager or its
+    config made afterwards require a new compilation.
+    """
+
+    __slots__ = (
+        "login_manager",
+        "config",
+        "session_keys",
+        "exempt_methods",
+        "protection_is_strong",
+        "loader_kind",
+        "loader",
+        "cookie_template",
+        "redirect_to",
+        "redirect_paths",
+        "redirect_cache",
+    )
+
+    login_manager: "LoginManager"
+    config: Config
+    session_keys: t.Tuple[str, ...]
+    exempt_methods: t.FrozenSet[str]
+    protection_is_strong: bool
+    loader_kind: t.Optional[str]
+    # User loader call of `loader_kind`, awaitable unless `LOADER_SYNC`
+    loader: t.Optional[t.Callable[..., t.Any]]
+    cookie_template: CookieTemplate
+    redirect_to: str
+    # Path of the `redirect_to` route, resolved once per router (routers
+    # are not hashable, keyed by id)
+    redirect_paths: t.Dict[int, t.Tuple["weakref.ref[t.Any]", URLPath]]
+    redirect_cache: t.Optional[TTLCache]
+
+    def __init__(self, login_manager: "LoginManager", app: t.Any = None):
+        config = login_manager.config
+        user_loader = login_manager._user_loader
+        loader: t.Optional[t.Callable[..., t.Any]] = user_loader
+        if login_manager.batch_loader is not None:
+            loader_kind: t.Optional[str] = LOADER_BATCH
+            loader = login_manager.batch_loader.load
+        elif user_loader is None:
+            loader_kind = None
+        elif login_manager._user_loader_is_async:
+            loader_kind = LOADER_ASYNC
+        elif login_manager.loader_executor is not None:
+            loader_kind = LOADER_EXECUTOR
+            loader = functools.partial(
+                login_manager.loader_executor.run, user_loader
+            )
+        else:
+            loader_kind = LOADER_SYNC
+
+        redirect_to = login_manager.redirect_to
+        redirect_paths: t.Dict[int, t.Tuple["weakref.ref[t.Any]", URLPath]] = (
+            {}
         )
+        if "/" not in redirect_to and app is not None:
+            try:
+                redirect_paths[id(app)] = (
+                    weakref.ref(app),
+                    app.url_path_for(redirect_to),
+                )
+            except NoMatchFound:
+                pass
+
+        values = {
+            "login_manager": login_manager,
+            "config": config,
+            "session_keys": config.session_keys,
+            "exempt_methods": frozenset(config.EXEMPT_METHODS),
+            "protection_is_strong": (
+                config.protection_level == ProtectionLevel.Strong
+            ),
+            "loader_kind": loader_kind,
+            "loader": loader,
+            "cookie_template": login_manager.cookie_template,
+            "redirect_to": redirect_to,
+            "redirect_paths": redirect_paths,
+            "redirect_cache": (
+                TTLCache(maxsize=config.REDIRECT_CACHE_SIZE)
+                if config.REDIRECT_CACHE_SIZE > 0
+                else None
+            ),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: t.Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def redirect_url(self, request: HTTPConnection) -> t.Any:
+        """Same as `request.url_for(redirect_to)`, without searching the
+        routes again
+        """
+        if "/" in self.redirect_to:
+            return self.redirect_to
+
+        router = request.scope.get("router") or request.scope["app"]
+        entry = self.redirect_paths.get(id(router))
+        if entry is not None and entry[0]() is router:
+            path = entry[1]
+        else:
+            path = router.url_path_for(self.redirect_to)
+            self.redirect_paths[id(router)] = (weakref.ref(router), path)
+        return path.make_absolute_url(request.base_url)
+
+    def login_redirect_url(self, request: HTTPConnection) -> str:
+        """Login URL with the `next` query parameter of `request`, same as
+        `make_next_url(redirect_url(request), str(request.url))`.
+
+        Login URLs are cached per router, host, scheme and root path.
+        """
+        scope = request.scope
+        cache = self.redirect_cache
+        key: t.Any = None
+        parts = None
+        if cache is not None:
+            router = scope.get("router") or scope.get("app")
+            server = scope.get("server")
+            key = (
+                id(router),
+                scope.get("scheme"),
+                _host_header(scope),
+                None if server is None else tuple(server),
+                scope.get("app_root_path", scope.get("root_path", "")),
+            )
+            entry = cache.get(key)
+            if entry is not None and entry[0]() is router:
+                parts = entry[1]
+        if parts is None:
+            parts = split_redirect_url(self.redirect_url(request))
+            if cache is not None:
+                cache.set(key, (weakref.ref(router), parts))
+
+        url = build_next_url(parts, scope)
+        if url is None:
+            url = make_next_url(self.redirect_url(request), str(request.url))
+        return url
 
 
 class LoginManager:
     def __init__(
         self,
         redirect_to: str,
-        secret_key: str,
+        secret_key: t.Union[str, t.Sequence[str]],
         config: t.Optional[Config] = None,
     ):
         self.config = config or Config()
         self.anonymous_user_cls = AnonymousUser
+        self._anonymous_user: t.Optional[AnonymousUser] = None
         # Name of redirect view when user need to log in.
         self.redirect_to = redirect_to
-        self.secret_key = secret_key
+        # Secret keys to rotate, the first one signs new cookies
+        if isinstance(secret_key, (str, bytes)):
+            self.secret_keys = [secret_key]
+        else:
+            self.secret_keys = list(secret_key)
+        self.secret_key = self.secret_keys[0]
+
+        assert (
+            self.config.IDENTIFIER_ALGORITHM in IDENTIFIER_ALGORITHMS
+        ), f"IDENTIFIER_ALGORITHM must be one of {IDENTIFIER_ALGORITHMS}"
+        self.cookie_codec = CookieCodec(
+            self.secret_keys,
+            digest=self.config.COOKIE_DIGEST,
+            digest_size=self.config.COOKIE_DIGEST_SIZE,
+            version=self.config.COOKIE_VERSION,
+        )
+        self.compile_cookie()
+        self.cookie_cache: t.Optional[TTLCache] = None
+        if self.config.COOKIE_CACHE_SIZE > 0:
+            self.cookie_cache = TTLCache(
+                maxsize=self.config.COOKIE_CACHE_SIZE,
+                ttl=self.config.COOKIE_CACHE_TTL,
+            )
+
+        # BLAKE2b key is limited to 64 bytes
+        self._identifier_key = _secret_key(self.secret_key)
+        if len(self._identifier_key) > 64:
+            self._identifier_key = sha512(self._identifier_key).digest()
 
         self._user_loader: t.Optional[t.Callable[..., UserMixin]] = None
+        self._user_loader_is_async = False
+        self.loader_executor: t.Optional[LoaderExecutor] = None
+        self.generation_store: t.Optional[GenerationStore] = None
+        self.user_cache: t.Optional[UserCache] = None
+        self.single_flight: t.Optional[SingleFlight] = None
+        self.circuit_breaker: t.Optional[CircuitBreaker] = None
+        self.batch_loader: t.Optional[BatchLoader] = None
+        self._plan: t.Optional[RuntimePlan] = None
+        self.metrics: t.Optional[AuthMetrics] = None
+        # Session writes skipped as the value was already set
+        self.session_writes_avoided = 0
         # Custom not authenticated callback for websocket
         self._ws_auth_fail_func: t.Optional[WebsocketAuthFailCallback] = None
 
     def set_user_loader(self, callback: t.Callable[..., UserMixin]):
         """Set custom user loader"""
         self._user_loader = callback
+        self._user_loader_is_async = asyncio.iscoroutinefunction(callback)
+        self._plan = None
+
+    def set_batch_user_loader(
+        self,
+        callback: t.Callable[..., t.Any],
+        window: float = 0.0,
+        max_batch_size: t.Optional[int] = None,
+    ):
+        """Set user loader resolving many user ids with a single call.
+
+        Used instead of `user_loader`, the callback receives the request
+        and a list of user ids, and returns a mapping of user id to user.
+        """
+        self.batch_loader = BatchLoader(callback, window, max_batch_size)
+        self._plan = None
+
+    def set_loader_executor(self, executor: t.Optional[LoaderExecutor]):
+        """Run sync `user_loader` in a thread pool, `None` to disable"""
+        self.loader_executor = executor
+        self._plan = None
+
+    def compile(self, app: t.Any = None) -> RuntimePlan:
+        """Freeze `config` and the user loader into the `RuntimePlan` used
+        by the middleware, backend and decorators.
+
+        `AuthenticationMiddleware` compiles on the ASGI lifespan startup,
+        the plan is otherwise compiled on first use. The `redirect_to`
+        route of `app` is resolved up front.
+        """
+        self.compile_cookie()
+        self._plan = RuntimePlan(self, app)
+        return self._plan
+
+    def get_plan(self) -> RuntimePlan:
+        """Compiled `RuntimePlan`, compiled on first use"""
+        plan = self._plan
+        if plan is None:
+            plan = self.compile()
+        return plan
+
+    def set_metrics(self, metrics: t.Optional[AuthMetrics]):
+        """Record authentication metrics, `None` to disable"""
+        self.metrics = metrics
+
+    def set_user_cache(self, cache: t.Optional[UserCache]):
+        """Set cache of loaded users, `None` to disable caching"""
+        self.user_cache = cache
+
+    def set_single_flight(self, single_flight: t.Optional[SingleFlight]):
+        """Coalesce concurrent loads of the same user, `None` to disable"""
+        self.single_flight = single_flight
+
+    def set_circuit_breaker(self, breaker: t.Optional[CircuitBreaker]):
+        """Guard `user_loader` calls with a deadline and a circuit breaker,
+        `None` to disable"""
+        self.circuit_breaker = breaker
+
+    def set_generation_store(self, store: t.Optional[GenerationStore]):
+        """Set store of per-user session generations, see `logout_all`"""
+        self.generation_store = store
+
+    def get_generation(self, user_id: t.Any) -> int:
+        if self.generation_store is None:
+            return 0
+        return self.generation_store.get(user_id)
+
+    def logout_all(self, user_id: t.Any) -> None:
+        """Revoke every session and remember cookie of the user"""
+        assert self.generation_store is not None, "generation store not set"
+        self.generation_store.bump(user_id)
+        if self.user_cache is not None:
+            self.user_cache.invalidate(user_id)
+        if (
+            self.circuit_breaker is not None
+            and self.circuit_breaker.stale is not None
+        ):
+            self.circuit_breaker.stale.invalidate(user_id)
 
     def set_ws_not_authenticated(self, callback: WebsocketAuthFailCallback):
         """Set not authenticated callback for websocket"""
@@ -86,59 +405,229 @@ class LoginManager:
         else:
             await self._ws_auth_fail_func(websocket)
 
+    @property
+    def anonymous_user(self) -> AnonymousUser:
+        """Shared instance of `anonymous_user_cls`"""
+        if type(self._anonymous_user) is not self.anonymous_user_cls:
+            self._anonymous_user = self.anonymous_user_cls()
+        return self._anonymous_user
+
+    @property
+    def user_loader_is_async(self) -> bool:
+        if self.batch_loader is not None:
+            return True
+        assert self._user_loader is not None, "`user_loader` is required"
+        return self._user_loader_is_async
+
     @property
     def user_loader(self):
         assert self._user_loader is not None, "`user_loader` is required"
         return self._user_loader
 
+    async def load_user(
+        self, conn: HTTPConnection, user_id: t.Any
+    ) -> UserMixin:
+        """Load user through the user cache (if any) and `user_loader`"""
+        cache = self.user_cache
+        if cache is not None:
+            user = cache.get_user(user_id)
+            if user is not None:
+                return user
+
+        breaker = self.circuit_breaker
+        if self.single_flight is not None:
+            if breaker is not None:
+                return await self.single_flight.do(
+                    str(user_id),
+                    lambda: breaker.call(
+                        user_id, lambda: self._load_user(conn, user_id)
+                    ),
+                )
+            return await self.single_flight.do(
+                str(user_id), lambda: self._load_user(conn, user_id)
+            )
+        if breaker is not None:
+            return await breaker.call(
+                user_id, lambda: self._load_user(conn, user_id)
+            )
+        return await self._load_user(conn, user_id)
+
+    def load_user_sync(
+        self, conn: HTTPConnection, user_id: t.Any
+    ) -> UserMixin:
+        """Load user with a sync `user_loader`, e.g. from `LazyUser`"""
+        cache = self.user_cache
+        if cache is not None:
+            user = cache.get_user(user_id)
+            if user is not None:
+                return user
+
+        if self.circuit_breaker is not None:
+            return self.circuit_breaker.call_sync(
+                user_id, lambda: self._load_user_sync(conn, user_id)
+            )
+        return self._load_user_sync(conn, user_id)
+
+    def _load_user_sync(
+        self, conn: HTTPConnection, user_id: t.Any
+    ) -> UserMixin:
+        cache = self.user_cache
+        metrics = self.metrics
+        trace = get_trace(conn)
+        if trace is not None:
+            span = trace.start(SPAN_USER_LOADER)
+        start = 0.0 if metrics is None else time.perf_counter()
+        try:
+            user = self.user_loader(conn, user_id)
+        finally:
+            if metrics is not None:
+                metrics.user_loader_seconds.observe(
+                    time.perf_counter() - start
+                )
+            if trace is not None:
+                trace.end(span)
+        if cache is not None and user is not None:
+            cache.set_user(user_id, user)
+        return user
+
+    async def _load_user(
+        self, conn: HTTPConnection, user_id: t.Any
+    ) -> UserMixin:
+        plan = self.get_plan()
+        metrics = self.metrics
+        start = 0.0 if metrics is None else time.perf_counter()
+        trace = get_trace(conn)
+        if trace is not None:
+            span = trace.start(SPAN_USER_LOADER)
+        try:
+            if plan.loader is None:
+                user = self.user_loader(conn, user_id)
+            elif plan.loader_kind == LOADER_SYNC:
+                user = plan.loader(conn, user_id)
+            else:
+                user = await plan.loader(conn, user_id)
+        finally:
+            if trace is not None:
+                trace.end(span)
+            if metrics is not None:
+                metrics.user_loader_seconds.observe(
+                    time.perf_counter() - start
+                )
+
+        if self.user_cache is not None and user is not None:
+            self.user_cache.set_user(user_id, user)
+        return user
+
     def build_redirect_url(self, request: HTTPConnection):
-        if "/" in self.redirect_to:
-            return self.redirect_to
-        return request.url_for(self.redirect_to)
+        return self.get_plan().redirect_url(request)
+
+    def create_identifier(self, conn: HTTPConnection) -> str:
+        return create_identifier(
+            conn, self.config.IDENTIFIER_ALGORITHM, self._identifier_key
+        )
+
+    def is_legacy_identifier(
+        self, conn: HTTPConnection, identifier: t.Optional[str]
+    ) -> bool:
+        """Identifier created with `sha512` before changing algorithm"""
+        if (
+            identifier is None
+            or self.config.IDENTIFIER_ALGORITHM == IDENTIFIER_SHA512
+            or not self.config.IDENTIFIER_ACCEPT_LEGACY
+        ):
+            return False
+        return hmac.compare_digest(identifier, create_identifier(conn))
+
+    def update_session(
+        self, session: t.MutableMapping[str, t.Any], key: str, value: t.Any
+    ) -> bool:
+        """Set `session[key]` only when the value changes, an unchanged
+        session is not signed and sent again.
+        """
+        current = session.get(key, _MISSING)
+        if type(current) is type(value) and current == value:
+            self.session_writes_avoided += 1
+            return False
+        session[key] = value
+        return True
 
     def protection_is_strong(self):
         return self.config.protection_level == ProtectionLevel.Strong
 
-    def set_cookie(self, message: Message, user_id: t.Any) -> Message:
-        key = self.config.COOKIE_NAME
-        value = encode_cookie(user_id, self.secret_key)
-        expires = int(self.config.COOKIE_DURATION.total_seconds())
-        path = self.config.COOKIE_PATH
-        domain = self.config.COOKIE_DOMAIN
-        secure = self.config.COOKIE_SECURE
-        httponly = self.config.COOKIE_HTTPONLY
-        samesite = self.config.COOKIE_SAMESITE
-
-        message.setdefault("headers", [])
-        headers = MutableHeaders(scope=message)
-        cookie: "http.cookies.BaseCookie[str]" = http.cookies.SimpleCookie()
-
-        cookie[key] = value
-        if expires is not None:
-            cookie[key]["expires"] = expires
-        if path is not None:
-            cookie[key]["path"] = path
-        if domain is not None:
-            cookie[key]["domain"] = domain
-        if secure:
-            cookie[key]["secure"] = True
-        if httponly:
-            cookie[key]["httponly"] = True
-        if samesite is not None:
-            assert samesite.lower() in [
-                "strict",
-                "lax",
-                "none",
-            ], "samesite must be either 'strict', 'lax' or 'none'"
-            cookie[key]["samesite"] = samesite
-
-        headers["set-cookie"] = cookie.output(header="").strip()
-        return message
+    def remember_duration(self, session: t.Mapping[str, t.Any]) -> float:
+        """Remember cookie duration of the session, in seconds"""
+        seconds = session.get(self.config.REMEMBER_SECONDS_NAME)
+        if seconds is None:
+            return self.config.COOKIE_DURATION.total_seconds()
+        return seconds
 
-    def clear_cookie(self, message: Message) -> Message:
-        message.setdefault("headers", [])
+    def remember_cookie_due(self, session: t.Mapping[str, t.Any]) -> bool:
+        """Whether the remember cookie has to be (re)issued: never issued
+        since login, or old enough for a sliding refresh.
+        """
+        issued = session.get(self.config.REMEMBER_ISSUED_NAME)
+        if issued is None:
+            return True
+        refresh_after = self.config.COOKIE_REFRESH_AFTER
+        if refresh_after is None:
+            return False
+        elapsed = time.time() - issued
+        return elapsed >= self.remember_duration(session) * refresh_after
+
+    def compile_cookie(self) -> None:
+        """Validate and pre-render the remember cookie attributes of
+        `config`, call it again after changing them.
+        """
+        self.cookie_template = CookieTemplate(
+            self.config.COOKIE_NAME,
+            path=self.config.COOKIE_PATH,
+            domain=self.config.COOKIE_DOMAIN,
+            secure=self.config.COOKIE_SECURE,
+            httponly=self.config.COOKIE_HTTPONLY,
+            samesite=self.config.COOKIE_SAMESITE,
+        )
 
-        return message
+    def set_cookie(
+        self,
+        message: Message,
+        user_id: t.Any,
+        duration: t.Optional[float] = None,
+    ) -> Message:
+        if duration is None:
+            duration = self.config.COOKIE_DURATION.total_seconds()
+        expires = int(time.time()) + int(duration)
+        value = self.cookie_codec.encode(
+            user_id,
+            expires=expires,
+            generation=self.get_generation(user_id),
+            duration=int(duration),
+        )
+        return self.cookie_template.set(message, value, expires)
+
+    def clear_cookie(self, message: Message) -> Message:
+        return self.cookie_template.clear(message)
 
     def get_cookie(self, cookie: str):
-        return decode_cookie(cookie, self.secret_key)
+        token = self.get_cookie_token(cookie)
+        return None if token is None else token.user_id
+
+    def get_cookie_token(self, cookie: str) -> t.Optional[RememberToken]:
+        """Valid `RememberToken` of the remember cookie, if any"""
+        cache = self.cookie_cache
+        token: t.Optional[RememberToken] = None
+        if cache is not None:
+            token = cache.get(cookie)
+        if token is None:
+            token = self.cookie_codec.decode_token(cookie)
+            if token is None:
+                return None
+            if cache is not None:
+                cache.set(cookie, token)
+
+        if token.expires and token.expires <= time.time():
+            return None
+        if self.generation_store is not None and (
+            token.generation or 0
+        ) != self.get_generation(token.user_id):
+            return None
+        return token
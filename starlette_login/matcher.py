@@ -0,0 +1,117 @@
+import re
+import typing as t
+
+PathPattern = t.Union[str, "re.Pattern[str]"]
+PathRule = t.Union[PathPattern, t.Tuple[t.Iterable[str], PathPattern]]
+
+_GLOB_CHARS = frozenset("*?[")
+# Characters escaped within a glob `[...]` set
+_SET_ESCAPE = re.compile(r"[\\\[&~|]")
+
+
+def _glob_regex(pattern: str) -> str:
+    """Translate a path glob, `*` and `?` do not match `/`, `**` matches
+    any number of path segments.
+    """
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        i += 1
+        if char == "*":
+            if pattern.startswith("*", i):
+                i += 1
+                parts.append(".*")
+            else:
+                parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            # `]` right after `[` or `[!` is part of the set
+            start = i + 1 if pattern.startswith("!", i) else i
+            end = pattern.find(
+                "]", start + 1 if pattern.startswith("]", start) else start
+            )
+            if end == -1:
+                parts.append(re.escape(char))
+                continue
+            chars = _SET_ESCAPE.sub(r"\\\g<0>", pattern[start:end])
+            if start > i:
+                parts.append(f"[^/{chars}]")
+            elif chars.startswith("^"):
+                parts.append(f"[\\{chars}]")
+            else:
+                parts.append(f"[{chars}]")
+            i = end + 1
+        else:
+            parts.append(re.escape(char))
+    return "(?s:{})\\Z".format("".join(parts))
+
+
+def _pattern_regex(pattern: str) -> str:
+    if _GLOB_CHARS.intersection(pattern):
+        return _glob_regex(pattern)
+    # Path prefix, e.g. `/static`
+    return re.escape(pattern)
+
+
+class _RuleSet(t.NamedTuple):
+    # Prefix and glob rules joined into one regex
+    regex: t.Optional["re.Pattern[str]"]
+    # Compiled regex rules, matched one by one with their own flags
+    patterns: t.Tuple["re.Pattern[str]", ...]
+
+    @classmethod
+    def create(cls, rules: t.List[PathPattern]) -> "_RuleSet":
+        strings = [
+            _pattern_regex(rule) for rule in rules if isinstance(rule, str)
+        ]
+        return cls(
+            re.compile("|".join(strings)) if strings else None,
+            tuple(rule for rule in rules if isinstance(rule, re.Pattern)),
+        )
+
+    def match(self, path: str) -> bool:
+        if self.regex is not None and self.regex.match(path) is not None:
+            return True
+        return any(pattern.match(path) for pattern in self.patterns)
+
+
+class PathMatcher:
+    """Request path rules, prefix and glob rules are compiled into a single
+    regex.
+
+    A rule is either:
+
+     - a path prefix: `"/static"`
+     - a glob matching the whole path: `"/api/*/health"`, `*` matches
+       within a path segment and `**` across segments: `"/docs/**"`
+     - a compiled regex matched at the start of the path, with its flags:
+       `re.compile(r"/users/\\d+/avatar")`
+     - a `(methods, pattern)` tuple, only matching these HTTP methods:
+       `(["GET", "HEAD"], "/metrics")`
+    """
+
+    def __init__(self, rules: t.Iterable[PathRule] = ()):
+        any_method: t.List[PathPattern] = []
+        by_method: t.Dict[str, t.List[PathPattern]] = {}
+        for rule in rules:
+            if isinstance(rule, tuple):
+                methods, pattern = rule
+                for method in methods:
+                    by_method.setdefault(method.upper(), []).append(pattern)
+            else:
+                any_method.append(rule)
+
+        self._any = _RuleSet.create(any_method)
+        self._by_method = {
+            method: _RuleSet.create(patterns + any_method)
+            for method, patterns in by_method.items()
+        }
+
+    def __bool__(self) -> bool:
+        return bool(self._any.regex or self._any.patterns or self._by_method)
+
+    def match(self, path: str, method: t.Optional[str] = None) -> bool:
+        rules = self._by_method.get(method, self._any) if method else self._any
+        return rules.match(path)
@@ -0,0 +1,229 @@
+import typing as t
+from bisect import bisect_left
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from 50us to 10s
+LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: t.Iterable[t.Tuple[str, str]]) -> str:
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", r"\\")
+            .replace("\n", r"\n")
+            .replace('"', r"\""),
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}" if pairs else ""
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: t.Sequence[str] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, values: t.Tuple[str, ...]) -> t.List[t.Tuple[str, str]]:
+        assert len(values) == len(
+            self.labelnames
+        ), f"{self.name} labels are {self.labelnames}"
+        return list(zip(self.labelnames, values))
+
+    def samples(self) -> t.Iterator[str]:
+        raise NotImplementedError()  # pragma: no cover
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: t.Sequence[str] = ()
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.values: t.Dict[t.Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        return self.values.get(labelvalues, 0)
+
+    def samples(self) -> t.Iterator[str]:
+        if not self.values and not self.labelnames:
+            yield f"{self.name} 0.0"
+        for labelvalues, value in sorted(self.values.items()):
+            labels = _format_labels(self._labels(labelvalues))
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: t.Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # Observations per bucket, the last one for `+Inf`
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> t.Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            labels = _format_labels([("le", _format_value(bound))])
+            yield f"{self.name}_bucket{labels} {_format_value(cumulative)}"
+        yield f"{self.name}_sum {_format_value(self.sum)}"
+        yield f"{self.name}_count {_format_value(self.count)}"
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text format.
+
+    The registry is an ASGI application serving the metrics:
+
+        routes = [Route("/metrics", registry)]
+    """
+
+    def __init__(self) -> None:
+        self.metrics: t.Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        assert (
+            metric.name not in self.metrics
+        ), f"{metric.name} is already registered"
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: t.Sequence[str] = ()
+    ) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.register(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        buckets: t.Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self.register(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(
+            metric.render() + "\n" for metric in self.metrics.values()
+        )
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        assert scope["type"] == "http"
+        response = Response(self.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+        await response(scope, receive, send)
+
+
+class AuthMetrics:
+    """Authentication metrics of `AuthenticationMiddleware`,
+    `SessionAuthBackend` and the decorators.
+
+    Set with `LoginManager.set_metrics`, nothing is recorded otherwise.
+    """
+
+    def __init__(
+        self,
+        registry: t.Optional[MetricsRegistry] = None,
+        prefix: str = "starlette_login_",
+    ):
+        self.registry = registry or MetricsRegistry()
+        self.requests = self.registry.counter(
+            f"{prefix}requests_total",
+            "Requests by authentication outcome",
+            ["outcome"],
+        )
+        self.remember_restored = self.registry.counter(
+            f"{prefix}remember_restored_total",
+            "Users authenticated from the remember cookie",
+        )
+        self.strong_protection_wipes = self.registry.counter(
+            f"{prefix}strong_protection_wipes_total",
+            "Sessions cleared by the strong protection",
+        )
+        self.redirects = self.registry.counter(
+            f"{prefix}redirects_total",
+            "Redirects to the login page",
+        )
+        self.authenticate_seconds = self.registry.histogram(
+            f"{prefix}authenticate_seconds",
+            "Time spent authenticating a request",
+        )
+        self.user_loader_seconds = self.registry.histogram(
+            f"{prefix}user_loader_seconds",
+            "Latency of the user loader",
+        )
+        self.cookie_decode_seconds = self.registry.histogram(
+            f"{prefix}cookie_decode_seconds",
+            "Time spent verifying the remember cookie",
+        )
+        self.fingerprint_seconds = self.registry.histogram(
+            f"{prefix}fingerprint_seconds",
+            "Time spent creating the session identifier",
+        )
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        await self.registry(scope, receive, send)
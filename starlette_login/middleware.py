@@ -1,10 +1,17 @@
+import time
 import typing as t
 
 from starlette.authentication import AuthCredentials, AuthenticationBackend
-from starlette.requests import HTTPConnection
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import RedirectResponse
 from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from .backends import SessionAuthBackend
 from .login_manager import LoginManager
+from .matcher import PathMatcher, PathRule
+from .mixins import user_is_authenticated
+from .policy import AuthPolicy, RoutePolicyIndex
+from .tracing import SPAN_AUTHENTICATE, TRACE_SCOPE_KEY, AuthTrace, SpanHooks
 
 
 class AuthenticationMiddleware:
@@ -13,62 +20,191 @@ class AuthenticationMiddleware:
         app: ASGIApp,
         backend: AuthenticationBackend,
         login_manager: LoginManager,
-        excluded_dirs: t.Optional[t.List[str]] = None,
+        excluded_dirs: t.Optional[t.List[PathRule]] = None,
         allow_websocket: bool = True,
+        included_dirs: t.Optional[t.List[PathRule]] = None,
+        route_policies: bool = False,
+        server_timing: bool = False,
+        span_hooks: t.Optional[SpanHooks] = None,
     ):
         self.app = app
         self.backend = backend
         self.excluded_dirs = excluded_dirs or []
+        self.excluded = PathMatcher(self.excluded_dirs)
+        # Only authenticate these paths when set
+        self.included_dirs = included_dirs
+        self.included = None
+        if included_dirs is not None:
+            self.included = PathMatcher(included_dirs)
         self.login_manager = login_manager
         self.secret_key = login_manager.secret_key
         self.allow_websocket = allow_websocket
+        # Skip or enforce authentication from the routes `AuthPolicy`
+        self.route_policies = route_policies
+        self.policy_index: t.Optional[RoutePolicyIndex] = None
+        # Anonymous request check of `SessionAuthBackend`, skipped when a
+        # subclass authenticates requests differently
+        self._is_anonymous: t.Optional[t.Callable[[Scope], bool]] = None
+        if isinstance(backend, SessionAuthBackend) and (
+            type(backend).authenticate is SessionAuthBackend.authenticate
+            and type(backend).get_user_id is SessionAuthBackend.get_user_id
+        ):
+            self._is_anonymous = backend.is_anonymous
+        # Report the authentication spans in the `Server-Timing` header
+        self.server_timing = server_timing
+        self.span_hooks = span_hooks
+        self.tracing = server_timing or span_hooks is not None
 
     async def __call__(
         self, scope: Scope, receive: Receive, send: Send
     ) -> None:
-        if self.allow_websocket is False and scope["type"] == "websocket":
+        if scope["type"] == "lifespan":
+            await self.app(scope, self.lifespan_receive(scope, receive), send)
+            return
+        elif self.allow_websocket is False and scope["type"] == "websocket":
             await self.app(scope, receive, send)
             return
         elif scope["type"] not in ("http", "websocket"):
             await self.app(scope, receive, send)
             return
 
-        # Excluded prefix path. E.g. /static
-        for prefix_dir in self.excluded_dirs:
-            if scope["path"].startswith(prefix_dir):
-                await self.app(scope, receive, send)
-                return
+        # Excluded path. E.g. /static
+        path = scope["path"]
+        method = scope.get("method")
+        if (self.excluded and self.excluded.match(path, method)) or (
+            self.included is not None and not self.included.match(path, method)
+        ):
+            await self.app(scope, receive, send)
+            return
 
-        conn = HTTPConnection(scope=scope, receive=receive)
+        plan = self.login_manager.get_plan()
+        policy = None
+        if self.route_policies:
+            policy = self.get_route_policy(scope)
 
-        auth_result = await self.backend.authenticate(conn)
-        if auth_result is None:
-            conn.scope["user"] = self.login_manager.anonymous_user_cls()
-            conn.scope["auth"] = AuthCredentials()
+        metrics = self.login_manager.metrics
+        trace: t.Optional[AuthTrace] = None
+        if policy is AuthPolicy.Public or (
+            self._is_anonymous is not None and self._is_anonymous(scope)
+        ):
+            # Neither session nor remember cookie, no need to authenticate
+            scope["user"] = self.login_manager.anonymous_user
+            scope["auth"] = AuthCredentials()
+            if metrics is not None:
+                metrics.requests.inc(
+                    "public" if policy is AuthPolicy.Public else "anonymous"
+                )
         else:
-            credentials, user = auth_result
-            if not user or user.is_authenticated is False:
-                conn.scope["user"] = self.login_manager.anonymous_user_cls()
+            conn = HTTPConnection(scope=scope, receive=receive)
+            if self.tracing:
+                trace = scope[TRACE_SCOPE_KEY] = AuthTrace(
+                    scope, self.span_hooks
+                )
+                span = trace.start(SPAN_AUTHENTICATE)
+            start = 0.0 if metrics is None else time.perf_counter()
+            try:
+                auth_result = await self.backend.authenticate(conn)
+            finally:
+                if metrics is not None:
+                    metrics.authenticate_seconds.observe(
+                        time.perf_counter() - start
+                    )
+                if trace is not None:
+                    trace.end(span)
+            if auth_result is None:
+                scope["user"] = self.login_manager.anonymous_user
+                scope["auth"] = AuthCredentials()
             else:
-                conn.scope["user"] = user
-            conn.scope["auth"] = credentials
+                credentials, user = auth_result
+                if not user_is_authenticated(user):
+                    scope["user"] = self.login_manager.anonymous_user
+                else:
+                    scope["user"] = user
+                scope["auth"] = credentials
+            if metrics is not None:
+                metrics.requests.inc(
+                    "authenticated"
+                    if user_is_authenticated(scope["user"])
+                    else "anonymous"
+                )
+
+        if scope["type"] == "websocket":
+            # No remember cookie to set on websocket messages
+            await self.app(scope, receive, send)
+            return
 
         async def custom_send(message: Message):
-            user_ = conn.scope["user"]
-            if user and user_.is_authenticated:
-                operation = conn.session.get(
-                    self.login_manager.config.REMEMBER_COOKIE_NAME
-                )
-                if operation == "set":
-                    message = self.login_manager.set_cookie(
-                        message=message, user_id=user_.identity
-                    )
-                elif operation == "clear":
-                    try:
-                        del conn.cookies[self.login_manager.config.COOKIE_NAME]
-                    except KeyError:
-                        pass
+            # Headers are only sent with the response start, body chunks
+            # are forwarded untouched
+            if message["type"] == "http.response.start":
+                message = self.update_remember_cookie(scope, message)
+                if self.server_timing and trace is not None:
+                    message = trace.add_header(message)
             await send(message)
 
+        if (
+            policy in (AuthPolicy.Login, AuthPolicy.FreshLogin)
+            and method not in plan.exempt_methods
+            and not user_is_authenticated(scope["user"])
+        ):
+            # Redirect before the endpoint runs
+            request = Request(scope, receive)
+            if policy is AuthPolicy.FreshLogin:
+                self.login_manager.update_session(
+                    request.session,
+                    self.login_manager.config.SESSION_NAME_ID,
+                    self.login_manager.create_identifier(request),
+                )
+            if metrics is not None:
+                metrics.redirects.inc()
+            response = RedirectResponse(
+                plan.login_redirect_url(request),
+                status_code=302,
+            )
+            await response(scope, receive, custom_send)
+            return
+
         await self.app(scope, receive, custom_send)
         return
+
+    def lifespan_receive(self, scope: Scope, receive: Receive) -> Receive:
+        """Compile the login manager on the application startup"""
+
+        async def wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.login_manager.compile(scope.get("app"))
+            return message
+
+        return wrapper
+
+    def update_remember_cookie(
+        self, scope: Scope, message: Message
+    ) -> Message:
+        """Issue the remember cookie once after login and again for a
+        sliding refresh, delete it after logout.
+        """
+        manager = self.login_manager
+        config = manager.config
+        session = scope["session"]
+        operation = session.get(config.REMEMBER_COOKIE_NAME)
+        if operation == "set":
+            user = scope["user"]
+            if user_is_authenticated(user) and manager.remember_cookie_due(
+                session
+            ):
+                message = manager.set_cookie(
+                    message, user.identity, manager.remember_duration(session)
+                )
+                session[config.REMEMBER_ISSUED_NAME] = int(time.time())
+        elif operation == "clear":
+            message = manager.clear_cookie(message)
+            session.pop(config.REMEMBER_COOKIE_NAME)
+            session.pop(config.REMEMBER_ISSUED_NAME, None)
+        return message
+
+    def get_route_policy(self, scope: Scope) -> t.Optional[AuthPolicy]:
+        if self.policy_index is None:
+            routes = getattr(scope.get("app"), "routes", None) or []
+            self.policy_index = RoutePolicyIndex(routes)
+        return self.policy_index.get(scope)
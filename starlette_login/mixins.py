@@ -1,4 +1,12 @@
+import typing as t
+
 from starlette.authentication import BaseUser
+from starlette.requests import HTTPConnection
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    from .login_manager import LoginManager
+
+_NOT_LOADED = object()
 
 
 class UserMixin(BaseUser):
@@ -27,3 +35,78 @@ class AnonymousUser(BaseUser):
     @property
     def identity(self):
         return
+
+
+class LazyUser(BaseUser):
+    """Proxy of the session user, loaded on first attribute access.
+
+    `identity` is read from the session and never triggers a load, use
+    `user_is_authenticated` for an authentication check without loading.
+    With an async or batch `user_loader`, call `await user.load()` before
+    accessing any other attribute.
+    """
+
+    def __init__(
+        self,
+        conn: HTTPConnection,
+        login_manager: "LoginManager",
+        user_id: t.Any,
+    ):
+        self._conn = conn
+        self._login_manager = login_manager
+        self._user_id = user_id
+        self._user: t.Any = _NOT_LOADED
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._user is not _NOT_LOADED
+
+    async def load(self) -> BaseUser:
+        if self._user is _NOT_LOADED:
+            self._resolve(
+                await self._login_manager.load_user(self._conn, self._user_id)
+            )
+        return self._user
+
+    def _resolve(self, user: t.Any) -> None:
+        if not user or user.is_authenticated is False:
+            user = self._login_manager.anonymous_user_cls()
+        self._user = user
+
+    def _get_user(self) -> t.Any:
+        if self._user is _NOT_LOADED:
+            if self._login_manager.user_loader_is_async:
+                raise RuntimeError(
+                    "Async `user_loader` can not be called on attribute "
+                    "access, call `await request.user.load()` first"
+                )
+            self._resolve(
+                self._login_manager.load_user_sync(self._conn, self._user_id)
+            )
+        return self._user
+
+    @property
+    def is_authenticated(self) -> bool:
+        return self._get_user().is_authenticated
+
+    @property
+    def display_name(self) -> str:
+        return self._get_user().display_name
+
+    @property
+    def identity(self) -> t.Any:
+        if self._user is _NOT_LOADED:
+            return self._user_id
+        return self._user.identity
+
+    def __getattr__(self, name: str) -> t.Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._get_user(), name)
+
+
+def user_is_authenticated(user: t.Any) -> bool:
+    """Authentication check that does not load a `LazyUser`"""
+    if isinstance(user, LazyUser) and not user.is_loaded:
+        return user.identity is not None
+    return bool(user) and getattr(user, "is_authenticated", False) is not False
@@ -0,0 +1,86 @@
+import typing as t
+from enum import Enum
+
+from starlette.routing import BaseRoute, Match, Route, WebSocketRoute
+from starlette.types import Scope
+
+AUTH_POLICY_ATTR = "__auth_policy__"
+
+
+class AuthPolicy(Enum):
+    # No authentication, the user is always anonymous
+    Public = 1
+    # Authenticated user is required
+    Login = 2
+    # Authenticated user with a fresh login is required
+    FreshLogin = 3
+
+
+def get_auth_policy(endpoint: t.Any) -> t.Optional[AuthPolicy]:
+    return getattr(endpoint, AUTH_POLICY_ATTR, None)
+
+
+def set_auth_policy(endpoint: t.Any, policy: AuthPolicy) -> None:
+    setattr(endpoint, AUTH_POLICY_ATTR, policy)
+
+
+class RoutePolicyIndex:
+    """Path to `AuthPolicy` index of the top level routes of a router.
+
+    Paths of routes without path parameters, not shared with another
+    route, are looked up in a dict. Other paths are matched in route
+    order with the request method, as the router does.
+    Routes of mounted applications have no policy.
+    """
+
+    def __init__(self, routes: t.Sequence[BaseRoute]):
+        self._static: t.Dict[t.Tuple[str, str], t.Optional[AuthPolicy]] = {}
+        self._routes: t.List[t.Tuple[BaseRoute, t.Optional[AuthPolicy]]] = []
+        # Paths of several routes, e.g. one route per method
+        shared: t.Set[t.Tuple[str, str]] = set()
+
+        for route in routes:
+            policy = None
+            if isinstance(route, (Route, WebSocketRoute)):
+                policy = get_auth_policy(route.endpoint)
+                scope_type = (
+                    "http" if isinstance(route, Route) else "websocket"
+                )
+                key = (scope_type, route.path)
+                shadowed = any(
+                    self._matches(other, scope_type, route.path)
+                    for other, _ in self._routes
+                )
+                if key in self._static:
+                    del self._static[key]
+                    shared.add(key)
+                elif (
+                    not route.param_convertors
+                    and not shadowed
+                    and key not in shared
+                ):
+                    self._static[key] = policy
+            self._routes.append((route, policy))
+
+    @staticmethod
+    def _matches(route: BaseRoute, scope_type: str, path: str) -> bool:
+        scope = {"type": scope_type, "path": path, "method": "GET"}
+        match, _ = route.matches(scope)
+        return match != Match.NONE
+
+    def get(self, scope: Scope) -> t.Optional[AuthPolicy]:
+        key = (scope["type"], scope["path"])
+        if key in self._static and not scope.get("root_path"):
+            return self._static[key]
+
+        # First route of another method, the router answers 405 when no
+        # route fully matches
+        partial: t.Optional[BaseRoute] = None
+        partial_policy = None
+        for route, policy in self._routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return policy
+            elif match == Match.PARTIAL and partial is None:
+                partial, partial_policy = route, policy
+        return partial_policy
@@ -0,0 +1,354 @@
+import inspect
+import json
+import secrets
+import sqlite3
+import threading
+import time
+import typing as t
+from datetime import timedelta
+
+import anyio.to_thread
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .cache import TTLCache
+
+SESSION_ID_LENGTH = 22  # `secrets.token_urlsafe(16)`
+_SESSION_ID_CHARS = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+)
+
+
+def create_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def is_session_id(value: str) -> bool:
+    return len(value) == SESSION_ID_LENGTH and _SESSION_ID_CHARS.issuperset(
+        value
+    )
+
+
+class SessionStore:
+    """Server side storage of session data keyed by session id"""
+
+    async def load(self, session_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        raise NotImplementedError()  # pragma: no cover
+
+    async def save(
+        self,
+        session_id: str,
+        data: t.Dict[str, t.Any],
+        max_age: t.Optional[int],
+    ) -> None:
+        raise NotImplementedError()  # pragma: no cover
+
+    async def delete(self, session_id: str) -> None:
+        raise NotImplementedError()  # pragma: no cover
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU session store, sessions are lost on restart.
+
+    Sessions expire after the `max_age` of the middleware, or after `ttl`
+    when the middleware has no `max_age`.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: t.Optional[t.Union[float, timedelta]] = None,
+    ):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def load(self, session_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        data = self.cache.get(session_id)
+        if data is None:
+            return None
+        return json.loads(data)
+
+    async def save(
+        self,
+        session_id: str,
+        data: t.Dict[str, t.Any],
+        max_age: t.Optional[int],
+    ) -> None:
+        self.cache.set(session_id, json.dumps(data), ttl=max_age)
+
+    async def delete(self, session_id: str) -> None:
+        self.cache.pop(session_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in a SQLite database file"""
+
+    def __init__(self, path: str, table: str = "starlette_login_session"):
+        assert table.isidentifier(), "table must be a valid identifier"
+        self.table = table
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL)"
+            )
+
+    async def load(self, session_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        return await anyio.to_thread.run_sync(self._load, session_id)
+
+    async def save(
+        self,
+        session_id: str,
+        data: t.Dict[str, t.Any],
+        max_age: t.Optional[int],
+    ) -> None:
+        await anyio.to_thread.run_sync(self._save, session_id, data, max_age)
+
+    async def delete(self, session_id: str) -> None:
+        await anyio.to_thread.run_sync(self._delete, session_id)
+
+    # Blocking database calls, run in a worker thread
+
+    def _load(self, session_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT data, expires FROM {self.table} WHERE id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        data, expires = row
+        if expires is not None and expires <= time.time():
+            self._delete(session_id)
+            return None
+        return json.loads(data)
+
+    def _save(
+        self,
+        session_id: str,
+        data: t.Dict[str, t.Any],
+        max_age: t.Optional[int],
+    ) -> None:
+        expires = time.time() + max_age if max_age else None
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (id, data, expires) "
+                "VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), expires),
+            )
+
+    def _delete(self, session_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE id = ?", (session_id,)
+            )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class RedisSessionStore(SessionStore):
+    """Session store on a Redis protocol compatible client.
+
+    The client needs `get(key)`, `set(key, value, ex=seconds)` and
+    `delete(key)` methods, either sync (`redis.Redis`) or async
+    (`redis.asyncio.Redis`).
+    """
+
+    def __init__(self, client: t.Any, prefix: str = "session:"):
+        self.client = client
+        self.prefix = prefix
+
+    @staticmethod
+    async def _result(value: t.Any) -> t.Any:
+        if inspect.isawaitable(value):
+            return await value
+        return value
+
+    async def load(self, session_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        data = await self._result(self.client.get(self.prefix + session_id))
+        if data is None:
+            return None
+        return json.loads(data)
+
+    async def save(
+        self,
+        session_id: str,
+        data: t.Dict[str, t.Any],
+        max_age: t.Optional[int],
+    ) -> None:
+        await self._result(
+            self.client.set(
+                self.prefix + session_id, json.dumps(data), ex=max_age
+            )
+        )
+
+    async def delete(self, session_id: str) -> None:
+        await self._result(self.client.delete(self.prefix + session_id))
+
+
+class ServerSessionMiddleware:
+    """Replacement of Starlette `SessionMiddleware` keeping the session
+    data in a `SessionStore`, the cookie only holds an opaque session id.
+
+    The session is saved only when its data changed. A new session id is
+    issued when the user id (`user_id_key`) of the session changes, e.g.
+    on login, against session fixation.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: SessionStore,
+        session_cookie: str = "session",
+        max_age: t.Optional[int] = 14 * 24 * 60 * 60,  # 14 days
+        path: str = "/",
+        same_site: str = "lax",
+        https_only: bool = False,
+        domain: t.Optional[str] = None,
+        user_id_key: str = "_user_id",
+    ):
+        assert same_site.lower() in [
+            "strict",
+            "lax",
+            "none",
+        ], "same_site must be either 'strict', 'lax' or 'none'"
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.path = path
+        # `Config.SESSION_NAME_KEY`
+        self.user_id_key = user_id_key
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+        if domain is not None:
+            self.security_flags += f"; domain={domain}"
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        conn = HTTPConnection(scope)
+        session_id: t.Optional[str] = conn.cookies.get(self.session_cookie)
+        data = None
+        if session_id is not None and is_session_id(session_id):
+            data = await self.store.load(session_id)
+        if data is None:
+            session_id = None
+            data = {}
+        scope["session"] = data
+        initial = json.dumps(data, sort_keys=True)
+        initial_user_id = data.get(self.user_id_key)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                changed = json.dumps(session, sort_keys=True) != initial
+                if session and (changed or session_id is None):
+                    if (
+                        session_id is not None
+                        and session.get(self.user_id_key) != initial_user_id
+                    ):
+                        # Logged in as another user, rotate the session id
+                        await self.store.delete(session_id)
+                        session_id = None
+                    if session_id is None:
+                        session_id = create_session_id()
+                        self._set_cookie(message, session_id, self.max_age)
+                    await self.store.save(session_id, session, self.max_age)
+                elif not session and session_id is not None:
+                    # The session has been cleared
+                    await self.store.delete(session_id)
+                    self._set_cookie(message, "null", 0)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _set_cookie(
+        self, message: Message, value: str, max_age: t.Optional[int]
+    ) -> None:
+        header_value = "{}={}; path={}; {}{}".format(
+            self.session_cookie,
+            value,
+            self.path,
+            f"Max-Age={max_age}; " if max_age is not None else "",
+            self.security_flags,
+        )
+        MutableHeaders(scope=message).append("Set-Cookie", header_value)
+
+
+class GenerationStore:
+    """Per-user session generation counter.
+
+    Remember cookies and sessions carry the generation of their user at
+    login time, bumping the counter revokes all of them at once.
+    """
+
+    def get(self, user_id: t.Any) -> int:
+        raise NotImplementedError()  # pragma: no cover
+
+    def bump(self, user_id: t.Any) -> int:
+        raise NotImplementedError()  # pragma: no cover
+
+
+class MemoryGenerationStore(GenerationStore):
+    """In-process generation store, for single process deployments"""
+
+    def __init__(self) -> None:
+        self._generations: t.Dict[str, int] = {}
+
+    def get(self, user_id: t.Any) -> int:
+        return self._generations.get(str(user_id), 0)
+
+    def bump(self, user_id: t.Any) -> int:
+        generation = self.get(user_id) + 1
+        self._generations[str(user_id)] = generation
+        return generation
+
+
+class RedisGenerationStore(GenerationStore):
+    """Generation store on a sync Redis protocol compatible client with
+    `get(key)` and `incr(key)` methods.
+
+    Generations are cached in process for `cache_ttl` seconds, revocation
+    from another process takes effect within that delay. `None` disables
+    the cache, with a blocking Redis call on every authenticated request.
+    """
+
+    def __init__(
+        self,
+        client: t.Any,
+        prefix: str = "generation:",
+        cache_ttl: t.Optional[t.Union[float, timedelta]] = 5,
+        cache_size: int = 10000,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.cache: t.Optional[TTLCache] = None
+        if cache_ttl:
+            self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def get(self, user_id: t.Any) -> int:
+        key = str(user_id)
+        if self.cache is not None:
+            generation = self.cache.get(key)
+            if generation is not None:
+                return generation
+
+        generation = int(self.client.get(self.prefix + key) or 0)
+        if self.cache is not None:
+            self.cache.set(key, generation)
+        return generation
+
+    def bump(self, user_id: t.Any) -> int:
+        generation = int(self.client.incr(self.prefix + str(user_id)))
+        if self.cache is not None:
+            self.cache.set(str(user_id), generation)
+        return generation
@@ -0,0 +1,110 @@
+import time
+import typing as t
+
+from starlette.types import Message, Scope
+
+# Scope key of the `AuthTrace` of the request
+TRACE_SCOPE_KEY = "starlette_login.trace"
+
+SPAN_AUTHENTICATE = "auth"
+SPAN_SESSION = "auth-session"
+SPAN_IDENTIFIER = "auth-identifier"
+SPAN_COOKIE = "auth-cookie"
+SPAN_USER_LOADER = "auth-user-loader"
+
+
+class Span:
+    __slots__ = ("name", "start", "end")
+
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.end: t.Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds, `0` while the span is running"""
+        if self.end is None:
+            return 0.0
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"Span({self.name!r}, duration={self.duration!r})"
+
+
+class SpanHooks:
+    """Tracing hooks called when a span of the authentication pipeline
+    starts and ends, e.g. to forward them to a tracing library.
+    """
+
+    def on_start(self, span: Span, scope: Scope) -> None:
+        pass  # pragma: no cover
+
+    def on_end(self, span: Span, scope: Scope) -> None:
+        pass  # pragma: no cover
+
+
+class InMemoryExporter(SpanHooks):
+    """Keep the ended spans in memory, for tests"""
+
+    def __init__(self) -> None:
+        self.spans: t.List[Span] = []
+
+    def on_end(self, span: Span, scope: Scope) -> None:
+        self.spans.append(span)
+
+    def names(self) -> t.List[str]:
+        return [span.name for span in self.spans]
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class AuthTrace:
+    """Spans of the authentication of one request.
+
+    Set in the request scope by `AuthenticationMiddleware` when tracing or
+    the `Server-Timing` header is enabled.
+    """
+
+    __slots__ = ("scope", "hooks", "spans")
+
+    def __init__(self, scope: Scope, hooks: t.Optional[SpanHooks] = None):
+        self.scope = scope
+        self.hooks = hooks
+        self.spans: t.List[Span] = []
+
+    def start(self, name: str) -> Span:
+        span = Span(name, time.perf_counter())
+        if self.hooks is not None:
+            self.hooks.on_start(span, self.scope)
+        return span
+
+    def end(self, span: Span) -> None:
+        span.end = time.perf_counter()
+        self.spans.append(span)
+        if self.hooks is not None:
+            self.hooks.on_end(span, self.scope)
+
+    def server_timing(self) -> str:
+        """`Server-Timing` header value, durations in milliseconds"""
+        return ", ".join(
+            f"{span.name};dur={span.duration * 1000:.3f}"
+            for span in self.spans
+        )
+
+    def add_header(self, message: Message) -> Message:
+        if self.spans:
+            headers = message.setdefault("headers", [])
+            if not isinstance(headers, list):
+                headers = message["headers"] = list(headers)
+            headers.append(
+                (b"server-timing", self.server_timing().encode("latin-1"))
+            )
+        return message
+
+
+def get_trace(conn: t.Any) -> t.Optional[AuthTrace]:
+    """`AuthTrace` of the connection, if any"""
+    scope = getattr(conn, "scope", None)
+    return None if scope is None else scope.get(TRACE_SCOPE_KEY)
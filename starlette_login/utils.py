@@ -1,16 +1,21 @@
+import functools
 import hmac
 import typing as t
 from datetime import timedelta
-from hashlib import sha512
+from hashlib import blake2b, sha512
 from urllib.parse import quote, urlparse, urlunparse
 
 from starlette.datastructures import URL
 from starlette.requests import Request
 
-from .mixins import AnonymousUser, UserMixin
+from .mixins import AnonymousUser, LazyUser, UserMixin
 
 LOGIN_MANAGER_ERROR = "LoginManager is not set"
 
+IDENTIFIER_SHA512 = "sha512"
+IDENTIFIER_BLAKE2B = "blake2b"
+IDENTIFIER_ALGORITHMS = (IDENTIFIER_SHA512, IDENTIFIER_BLAKE2B)
+
 
 async def login_user(
     request: Request,
@@ -28,14 +33,29 @@ async def login_user(
 
     config = login_manager.config
 
-    request.session[config.SESSION_NAME_KEY] = user.identity
-    request.session[config.SESSION_NAME_FRESH] = fresh
-    request.session[config.SESSION_NAME_ID] = create_identifier(request)
+    update_session = login_manager.update_session
+    update_session(request.session, config.SESSION_NAME_KEY, user.identity)
+    update_session(request.session, config.SESSION_NAME_FRESH, fresh)
+    update_session(
+        request.session,
+        config.SESSION_NAME_ID,
+        login_manager.create_identifier(request),
+    )
+    if login_manager.generation_store is not None:
+        update_session(
+            request.session,
+            config.SESSION_NAME_GENERATION,
+            login_manager.get_generation(user.identity),
+        )
     if remember:
-        request.session[config.REMEMBER_COOKIE_NAME] = "set"
+        update_session(request.session, config.REMEMBER_COOKIE_NAME, "set")
+        # Issue a new cookie with the response
+        request.session.pop(config.REMEMBER_ISSUED_NAME, None)
         if duration is not None:
-            request.session[config.REMEMBER_SECONDS_NAME] = (
-                duration.total_seconds()
+            update_session(
+                request.session,
+                config.REMEMBER_SECONDS_NAME,
+                duration.total_seconds(),
             )
 
     request.scope["user"] = user
@@ -62,27 +82,62 @@ async def logout_user(request: Request) -> None:
     if session_id in request.session:
         request.session.pop(session_id)
 
+    if config.SESSION_NAME_GENERATION in request.session:
+        request.session.pop(config.SESSION_NAME_GENERATION)
+
     if remember_cookie in request.session:
-        request.session[remember_cookie] = "clear"
+        login_manager.update_session(request.session, remember_cookie, "clear")
         if remember_seconds in request.session:
             request.session.pop(remember_seconds)
+        if config.REMEMBER_ISSUED_NAME in request.session:
+            request.session.pop(config.REMEMBER_ISSUED_NAME)
 
     request.scope["user"] = AnonymousUser()
 
 
+async def resolve_user(request: Request) -> t.Any:
+    """Return `request.user`, loading it first if it is a `LazyUser`"""
+    user = request.scope.get("user")
+    if isinstance(user, LazyUser):
+        return await user.load()
+    return user
+
+
+def has_cookie(scope: t.MutableMapping[str, t.Any], name: bytes) -> bool:
+    """Whether the raw `cookie` headers may contain cookie `name`"""
+    marker = name + b"="
+    for key, value in scope.get("headers", ()):
+        if key == b"cookie" and marker in value:
+            return True
+    return False
+
+
 def encode_cookie(payload: t.Any, key: str) -> str:
+    return _encode_cookie(payload, cookie_hmac(key))
+
+
+def decode_cookie(cookie: str, key: str) -> t.Optional[str]:
+    return _decode_cookie(cookie, cookie_hmac(key))
+
+
+def cookie_hmac(key: t.Union[bytes, str]) -> "hmac.HMAC":
+    """Keyed HMAC of cookie digests, copied for every cookie"""
+    return hmac.new(_secret_key(key), digestmod=sha512)
+
+
+def _encode_cookie(payload: t.Any, mac: "hmac.HMAC") -> str:
     if not isinstance(payload, str):
         payload = str(payload)
-    return f"{payload}|{_cookie_digest(payload, key=key)}"
+    return f"{payload}|{_hmac_digest(payload, mac)}"
 
 
-def decode_cookie(cookie: str, key: str) -> t.Optional[str]:
+def _decode_cookie(cookie: str, mac: "hmac.HMAC") -> t.Optional[str]:
     try:
         payload, digest = cookie.rsplit("|", 1)
     except ValueError:
         return None
 
-    if hmac.compare_digest(_cookie_digest(payload, key=key), digest):
+    if hmac.compare_digest(_hmac_digest(payload, mac), digest):
         return payload
     return None
 
@@ -115,6 +170,57 @@ def make_next_url(redirect_url: str, next_url: t.Optional[str] = None) -> str:
     return urlunparse(result_url)
 
 
+class RedirectURLParts(t.NamedTuple):
+    scheme: str
+    # Everything before the query string
+    prefix: str
+    query: str
+    fragment: str
+
+
+def split_redirect_url(redirect_url: t.Union[str, URL]) -> RedirectURLParts:
+    r_url = urlparse(str(redirect_url))
+    return RedirectURLParts(
+        r_url.scheme,
+        urlunparse(r_url._replace(query="", fragment="")),
+        r_url.query,
+        r_url.fragment,
+    )
+
+
+def build_next_url(
+    parts: RedirectURLParts, scope: t.Mapping[str, t.Any]
+) -> t.Optional[str]:
+    """Same as `make_next_url(redirect_url, str(request.url))`, without
+    building and parsing the request URL.
+
+    Returns `None` for requests that need the full `make_next_url`, e.g.
+    when parsing the request URL drops part of its path: an empty `;`
+    parameter or a `?` in the path.
+    """
+    path = scope["path"]
+    query_string = scope.get("query_string", b"")
+    if (
+        (parts.scheme and parts.scheme != scope.get("scheme", "http"))
+        or scope.get("server") is None
+        or "#" in path
+        or "?" in path
+        or path.endswith(";")
+        or b"#" in query_string
+    ):
+        return None
+
+    if query_string:
+        path = "?".join((path, query_string.decode()))
+    param_next = "=".join(("next", quote(path)))
+    if parts.query:
+        param_next = "&".join((parts.query, param_next))
+    url = "?".join((parts.prefix, param_next))
+    if parts.fragment:
+        url = "#".join((url, parts.fragment))
+    return url
+
+
 def _get_remote_address(request: Request) -> t.Optional[str]:
     address = request.headers.get("X-Forwarded-For")
     if address is not None:
@@ -128,11 +234,35 @@ def _get_remote_address(request: Request) -> t.Optional[str]:
     return address
 
 
-def create_identifier(request) -> str:
-    user_agent = request.headers.get("User-Agent")
+def create_identifier(
+    request,
+    algorithm: str = IDENTIFIER_SHA512,
+    key: t.Optional[bytes] = None,
+) -> str:
+    return _fingerprint(
+        _get_remote_address(request),
+        request.headers.get("User-Agent"),
+        algorithm,
+        key,
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def _fingerprint(
+    address: t.Optional[str],
+    user_agent: t.Optional[str],
+    algorithm: str,
+    key: t.Optional[bytes],
+) -> str:
+    if algorithm == IDENTIFIER_BLAKE2B:
+        data = f"{address}|{user_agent}".encode("utf8")
+        return blake2b(data, key=key or b"", digest_size=16).hexdigest()
+
+    user_agent_bytes = None
     if user_agent is not None:
-        user_agent = user_agent.encode("utf-8")
-    base = f"{_get_remote_address(request)}|{user_agent}"
+        user_agent_bytes = user_agent.encode("utf-8")
+    # `repr` of the user agent bytes, as in the identifiers of 1.0
+    base = f"{address}|{user_agent_bytes!r}"
     h = sha512()
     h.update(base.encode("utf8"))
     return h.hexdigest()
@@ -145,7 +275,7 @@ def _secret_key(secret_key: t.Union[bytes, str]) -> bytes:
     return secret_key
 
 
-def _cookie_digest(payload: str, key: str) -> str:
-    return hmac.new(
-        _secret_key(key), payload.encode("utf-8"), sha512
-    ).hexdigest()
+def _hmac_digest(payload: str, mac: "hmac.HMAC") -> str:
+    mac = mac.copy()
+    mac.update(payload.encode("utf-8"))
+    return mac.hexdigest()
@@ -19,6 +19,7 @@ from .views import (
     login_page,
     logout_page,
     protected_page,
+    public_page,
     sync_fresh_login,
     sync_protected_page,
     un_fresh_login,
@@ -31,6 +32,7 @@ routes = [
     Route("/login", login_page, methods=["GET", "POST"], name="login"),
     Route("/logout", logout_page, name="logout"),
     Route("/protected", protected_page, name="protected"),
+    Route("/public", public_page, name="public"),
     Route("/fresh", sync_fresh_login, name="sync_fresh_login"),
     Route("/fresh_async", async_fresh_login, name="async_fresh_login"),
     Route("/un_fresh", un_fresh_login, name="un_fresh"),
@@ -86,3 +88,25 @@ async def secure_app():
 @pytest.fixture
 def secure_test_client(secure_app):
     return TestClient(secure_app)
+
+
+@pytest.fixture
+def app_factory():
+    def create_app(manager, **kwargs):
+        kwargs.setdefault("excluded_dirs", ["/excluded"])
+        kwargs.setdefault("backend", SessionAuthBackend(manager))
+        middlewares = [
+            Middleware(SessionMiddleware, secret_key="secret"),
+            Middleware(
+                AuthenticationMiddleware,
+                login_manager=manager,
+                **kwargs,
+            ),
+        ]
+        application = Starlette(
+            debug=True, routes=routes, middleware=middlewares
+        )
+        application.state.login_manager = manager
+        return application
+
+    return create_app
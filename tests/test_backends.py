@@ -1,4 +1,8 @@
 import pytest
+from starlette.testclient import TestClient
+
+from starlette_login.backends import SessionAuthBackend
+from starlette_login.login_manager import LoginManager
 
 from .extension import login_manager
 from .model import user_list
@@ -38,3 +42,60 @@ class TestSessionAuthBackend:
 
         assert resp.status_code == 200
         assert "login" not in str(resp.url)
+
+
+@pytest.mark.asyncio
+class TestLazySessionAuthBackend:
+    def create_client(self, app_factory):
+        calls = []
+
+        def loader(request, user_id):
+            calls.append(user_id)
+            return user_list.user_loader(request, user_id)
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(loader)
+        app = app_factory(manager, backend=SessionAuthBackend(manager, True))
+        return TestClient(app), calls
+
+    async def test_untouched_user_not_loaded(self, app_factory):
+        client, calls = self.create_client(app_factory)
+        client.post(
+            "/login",
+            data={"username": "user1", "password": "password"},
+            follow_redirects=False,
+        )
+
+        resp = client.get("/un_fresh")
+        assert resp.status_code == 200
+        assert calls == []
+
+    async def test_login_required_not_loaded(self, app_factory):
+        client, calls = self.create_client(app_factory)
+        resp = client.get("/protected", follow_redirects=False)
+        assert resp.status_code == 302
+
+        client.post(
+            "/login",
+            data={"username": "user1", "password": "password"},
+            follow_redirects=False,
+        )
+        resp = client.get("/protected")
+        assert resp.status_code == 200
+        assert b"user1" in resp.content
+        assert calls == [1]
+
+
+@pytest.mark.asyncio
+class TestRememberCookieRotation:
+    async def test_cookie_of_rotated_key(self, app_factory):
+        old_manager = LoginManager(redirect_to="login", secret_key="old")
+        manager = LoginManager(redirect_to="login", secret_key=["new", "old"])
+        manager.set_user_loader(user_list.user_loader)
+        client = TestClient(app_factory(manager))
+
+        client.cookies["remember_token"] = old_manager.cookie_codec.encode(1)
+        resp = client.get("/protected")
+
+        assert resp.status_code == 200
+        assert b"user1" in resp.content
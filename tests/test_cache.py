@@ -0,0 +1,125 @@
+import pytest
+from starlette.testclient import TestClient
+
+from starlette_login.cache import TTLCache, UserCache
+from starlette_login.login_manager import LoginManager
+
+from .model import user_list
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache:
+    def test_get_set(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_ttl(self):
+        timer = FakeTimer()
+        cache = TTLCache(maxsize=2, ttl=10, timer=timer)
+        cache.set("a", 1)
+
+        timer.now = 9
+        assert cache.get("a") == 1
+        timer.now = 10
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.evictions == 1
+
+    def test_fifo_eviction(self):
+        cache = TTLCache(maxsize=2, eviction="fifo")
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert "a" not in cache
+        assert "b" in cache
+
+    def test_invalid_eviction(self):
+        with pytest.raises(AssertionError):
+            TTLCache(eviction="random")
+
+
+class TestUserCache:
+    def test_identity_normalized(self):
+        cache = UserCache()
+        cache.set_user(1, "user")
+
+        assert cache.get_user("1") == "user"
+        cache.invalidate("1")
+        assert cache.get_user(1) is None
+
+    def test_clear(self):
+        cache = UserCache()
+        cache.set_user(1, "user")
+        cache.clear()
+
+        assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+class TestLoginManagerUserCache:
+    async def test_cached_user_skips_loader(self, app_factory):
+        calls = []
+
+        def loader(request, user_id):
+            calls.append(user_id)
+            return user_list.user_loader(request, user_id)
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(loader)
+        manager.set_user_cache(UserCache(maxsize=10, ttl=60))
+        client = TestClient(app_factory(manager))
+
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+        for _ in range(3):
+            resp = client.get("/protected")
+            assert resp.status_code == 200
+
+        assert len(calls) == 1
+        assert manager.user_cache.hits >= 3
+
+    async def test_invalidate(self, app_factory):
+        calls = []
+
+        def loader(request, user_id):
+            calls.append(user_id)
+            return user_list.user_loader(request, user_id)
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(loader)
+        manager.set_user_cache(UserCache())
+        client = TestClient(app_factory(manager))
+
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+        client.get("/protected")
+        manager.user_cache.invalidate(1)
+        client.get("/protected")
+
+        assert len(calls) == 2
@@ -0,0 +1,128 @@
+import http.cookies
+import time
+from email.utils import formatdate
+
+import pytest
+
+from starlette_login.codec import (
+    CookieCodec,
+    CookieTemplate,
+    RememberToken,
+    key_id,
+)
+from starlette_login.utils import encode_cookie
+
+
+class TestCookieCodec:
+    def test_encode_decode(self):
+        codec = CookieCodec(["secret"])
+        cookie = codec.encode(1)
+
+        assert cookie.startswith(f"2.{key_id('secret')}.0.0.0.1.")
+        assert codec.decode(cookie) == "1"
+        assert codec.decode_token(cookie) == RememberToken("1", 0, 0, 0)
+
+    def test_expires_generation(self):
+        codec = CookieCodec(["secret"])
+        cookie = codec.encode(
+            1, expires=1700000000, generation=3, duration=86400
+        )
+
+        assert codec.decode_token(cookie) == RememberToken(
+            "1", 1700000000, 3, 86400
+        )
+        assert codec.decode(cookie.replace(".3.", ".4.", 1)) is None
+
+    def test_compact(self):
+        codec = CookieCodec(["secret"])
+
+        assert len(codec.encode(1)) < len(encode_cookie(1, "secret")) / 3
+
+    @pytest.mark.parametrize("digest", ["sha256", "sha512", "blake2b"])
+    @pytest.mark.parametrize("digest_size", [8, None])
+    def test_digest(self, digest, digest_size):
+        codec = CookieCodec(["secret"], digest, digest_size)
+
+        assert codec.decode(codec.encode("user.1")) == "user.1"
+
+    def test_invalid_digest(self):
+        with pytest.raises(AssertionError):
+            CookieCodec(["secret"], digest="md5")
+
+    @pytest.mark.parametrize("digest_size", [0, 4, 33])
+    def test_invalid_digest_size(self, digest_size):
+        with pytest.raises(AssertionError):
+            CookieCodec(["secret"], "sha256", digest_size)
+
+    def test_tampered(self):
+        codec = CookieCodec(["secret"])
+        cookie = codec.encode(1)
+        prefix, _, digest = cookie.rpartition(".")
+
+        assert codec.decode(prefix.replace(".1", ".2") + "." + digest) is None
+        assert codec.decode(cookie[:-1]) is None
+        assert codec.decode("2.xx") is None
+
+    def test_legacy_format(self):
+        codec = CookieCodec(["secret"])
+
+        assert codec.decode(encode_cookie(1, "secret")) == "1"
+        assert codec.decode_token(encode_cookie(1, "secret")) == (
+            RememberToken("1")
+        )
+        assert codec.decode(encode_cookie("2.1", "secret")) == "2.1"
+
+    def test_version_1(self):
+        codec = CookieCodec(["secret"], version=1)
+
+        assert codec.encode(1) == encode_cookie(1, "secret")
+
+    def test_key_rotation(self):
+        old_codec = CookieCodec(["old"])
+        codec = CookieCodec(["new", "old"])
+        cookie = old_codec.encode(1)
+
+        assert codec.decode(cookie) == "1"
+        assert codec.decode(encode_cookie(1, "old")) == "1"
+        assert codec.encode(1).startswith(f"2.{key_id('new')}.")
+        assert CookieCodec(["new"]).decode(cookie) is None
+
+
+class TestCookieTemplate:
+    @pytest.mark.parametrize(
+        "attributes",
+        [
+            {},
+            {"path": None, "httponly": False},
+            {"domain": "example.com", "secure": True, "samesite": "lax"},
+        ],
+    )
+    def test_simple_cookie_output(self, attributes):
+        template = CookieTemplate("remember_token", **attributes)
+        expires = int(time.time()) + 3600
+
+        cookie = http.cookies.SimpleCookie()
+        cookie["remember_token"] = "2.abc.1:2"
+        cookie["remember_token"]["expires"] = formatdate(expires, usegmt=True)
+        defaults = {"path": "/", "httponly": True}
+        for key, value in dict(defaults, **attributes).items():
+            if value:
+                cookie["remember_token"][key] = value
+        expected = cookie.output(header="").strip()
+
+        assert template.render("2.abc.1:2", expires).decode() == expected
+
+    def test_invalid_samesite(self):
+        with pytest.raises(AssertionError):
+            CookieTemplate("remember_token", samesite="invalid")
+
+    def test_append(self):
+        template = CookieTemplate("remember_token")
+        message = {"headers": ((b"set-cookie", b"session=1"),)}
+
+        template.set(message, "value", 0)
+        template.clear(message)
+
+        assert [key for key, _ in message["headers"]] == [b"set-cookie"] * 3
+        assert message["headers"][2][1].startswith(b'remember_token="";')
+        assert b"Max-Age=0" in message["headers"][2][1]
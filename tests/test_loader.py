@@ -0,0 +1,463 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from starlette.requests import HTTPConnection
+from starlette.testclient import TestClient
+
+from starlette_login.backends import SessionAuthBackend
+from starlette_login.cache import UserCache
+from starlette_login.loader import (
+    BREAKER_CLOSED,
+    BREAKER_HALF_OPEN,
+    BREAKER_OPEN,
+    BatchLoader,
+    CircuitBreaker,
+    LoaderExecutor,
+    SingleFlight,
+)
+from starlette_login.login_manager import LoginManager
+from starlette_login.session import MemoryGenerationStore
+
+from .model import user_list
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+    async def test_concurrent_calls_coalesced(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "user"
+
+        results = await asyncio.gather(
+            *[single_flight.do("1", load) for _ in range(20)]
+        )
+
+        assert results == ["user"] * 20
+        assert len(calls) == 1
+        assert single_flight.coalesced == 19
+        assert len(single_flight) == 0
+
+    async def test_exception_shared(self):
+        single_flight = SingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            raise ValueError("database down")
+
+        results = await asyncio.gather(
+            *[single_flight.do("1", load) for _ in range(3)],
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(single_flight) == 0
+
+    async def test_cancelled_waiter(self):
+        single_flight = SingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            return "user"
+
+        first = asyncio.ensure_future(single_flight.do("1", load))
+        second = asyncio.ensure_future(single_flight.do("1", load))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == "user"
+
+    async def test_login_manager(self):
+        calls = []
+
+        async def loader(request, user_id):
+            calls.append(user_id)
+            await asyncio.sleep(0.01)
+            return await user_list.async_user_loader(request, user_id)
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(loader)
+        manager.set_single_flight(SingleFlight())
+        manager.set_user_cache(UserCache())
+
+        users = await asyncio.gather(
+            *[manager.load_user(None, 1) for _ in range(10)]
+        )
+
+        assert all(user.identity == 1 for user in users)
+        assert len(calls) == 1
+        assert manager.user_cache.get_user(1) is users[0]
+
+
+@pytest.mark.asyncio
+class TestBatchLoader:
+    async def test_same_tick_batched(self):
+        batches = []
+
+        async def batch_fn(conn, user_ids):
+            batches.append(sorted(user_ids))
+            return {user_id: f"user{user_id}" for user_id in user_ids}
+
+        batch_loader = BatchLoader(batch_fn)
+        results = await asyncio.gather(
+            *[batch_loader.load(None, user_id) for user_id in (1, 2, 3, 1)]
+        )
+
+        assert results == ["user1", "user2", "user3", "user1"]
+        assert batches == [[1, 2, 3]]
+
+    async def test_sync_batch_fn_missing_key(self):
+        def batch_fn(conn, user_ids):
+            return {"1": "user1"}
+
+        batch_loader = BatchLoader(batch_fn)
+        results = await asyncio.gather(
+            batch_loader.load(None, 1), batch_loader.load(None, 2)
+        )
+
+        assert results == ["user1", None]
+
+    async def test_window(self):
+        batches = []
+
+        def batch_fn(conn, user_ids):
+            batches.append(user_ids)
+            return {}
+
+        batch_loader = BatchLoader(batch_fn, window=0.01)
+        first = asyncio.ensure_future(batch_loader.load(None, 1))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(batch_loader.load(None, 2))
+        await asyncio.gather(first, second)
+
+        assert batches == [[1, 2]]
+
+    async def test_max_batch_size(self):
+        batches = []
+
+        def batch_fn(conn, user_ids):
+            batches.append(user_ids)
+            return {}
+
+        batch_loader = BatchLoader(batch_fn, max_batch_size=2)
+        await asyncio.gather(
+            *[batch_loader.load(None, user_id) for user_id in (1, 2, 3)]
+        )
+
+        assert batches == [[1, 2], [3]]
+
+    async def test_exception(self):
+        async def batch_fn(conn, user_ids):
+            raise ValueError("database down")
+
+        batch_loader = BatchLoader(batch_fn)
+        results = await asyncio.gather(
+            batch_loader.load(None, 1),
+            batch_loader.load(None, 2),
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+
+    async def test_login_manager(self):
+        batches = []
+
+        async def batch_fn(request, user_ids):
+            batches.append(user_ids)
+            return {
+                user_id: user_list.get_by_id(int(user_id))
+                for user_id in user_ids
+            }
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_batch_user_loader(batch_fn)
+
+        users = await asyncio.gather(
+            *[manager.load_user(None, user_id) for user_id in (1, 2, "3")]
+        )
+
+        assert [user.username for user in users] == ["user1", "user2", "admin"]
+        assert len(batches) == 1
+        assert manager.user_loader_is_async is True
+
+
+@pytest.mark.asyncio
+class TestLoaderExecutor:
+    async def test_run_off_event_loop(self):
+        executor = LoaderExecutor(max_workers=2)
+
+        result = await executor.run(lambda: threading.current_thread().name)
+
+        assert result.startswith("starlette-login")
+        assert executor.stats["completed"] == 1
+        executor.shutdown()
+
+    async def test_bounded_concurrency(self):
+        executor = LoaderExecutor(max_workers=1)
+        running = []
+
+        def load(user_id):
+            running.append(executor.active)
+            time.sleep(0.01)
+            return user_id
+
+        results = await asyncio.gather(
+            *[executor.run(load, i) for i in range(3)]
+        )
+
+        assert results == [0, 1, 2]
+        assert running == [1, 1, 1]
+        assert executor.peak_queued >= 2
+        assert executor.queued == 0
+        assert executor.active == 0
+        executor.shutdown()
+
+    async def test_cancelled_while_queued(self):
+        executor = LoaderExecutor(max_workers=1)
+        first = asyncio.ensure_future(executor.run(time.sleep, 0.05))
+        second = asyncio.ensure_future(executor.run(time.sleep, 0.05))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        await first
+
+        assert executor.queued == 0
+        executor.shutdown()
+
+    async def test_login_manager(self):
+        threads = []
+
+        def loader(request, user_id):
+            threads.append(threading.current_thread())
+            return user_list.user_loader(request, user_id)
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(loader)
+        manager.set_loader_executor(LoaderExecutor(max_workers=2))
+
+        user = await manager.load_user(None, 1)
+
+        assert user.username == "user1"
+        assert threads[0] is not threading.current_thread()
+        manager.loader_executor.shutdown()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+class TestCircuitBreaker:
+    def create_manager(self, breaker, fail):
+        async def loader(request, user_id):
+            if fail:
+                raise ConnectionError("database down")
+            return user_list.user_loader(request, user_id)
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(loader)
+        manager.set_circuit_breaker(breaker)
+        return manager
+
+    async def test_timeout(self):
+        breaker = CircuitBreaker(timeout=0.01, fallback="anonymous")
+
+        async def load():
+            await asyncio.sleep(1)
+            return "user"  # pragma: no cover
+
+        assert await breaker.call(1, load) is None
+        assert breaker.timeouts == 1
+        assert breaker.state == BREAKER_CLOSED
+
+    async def test_open_and_recover(self):
+        clock = Clock()
+        transitions = []
+        breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, timer=clock
+        )
+        breaker.on_state_change(lambda old, new: transitions.append(new))
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            raise ConnectionError("database down")
+
+        async def load():
+            calls.append(1)
+            return "user1"
+
+        assert await breaker.call(1, load) == "user1"
+        # Closed, the error is raised
+        with pytest.raises(ConnectionError):
+            await breaker.call(1, fail)
+        assert await breaker.call(2, fail) is None
+        assert breaker.state == BREAKER_OPEN
+        assert isinstance(breaker.last_error, ConnectionError)
+
+        # Open, the loader is not called
+        assert await breaker.call(1, load) == "user1"
+        assert len(calls) == 3
+        assert breaker.rejected == 1
+
+        # Failed trial call
+        clock.now = 10
+        assert await breaker.call(1, fail) == "user1"
+        assert breaker.state == BREAKER_OPEN
+
+        clock.now = 20
+        assert await breaker.call(1, load) == "user1"
+        assert breaker.state == BREAKER_CLOSED
+        assert transitions == [
+            BREAKER_OPEN,
+            BREAKER_HALF_OPEN,
+            BREAKER_OPEN,
+            BREAKER_HALF_OPEN,
+            BREAKER_CLOSED,
+        ]
+
+    async def test_slow_sync_loader(self):
+        clock = Clock()
+        breaker = CircuitBreaker(timeout=1, failure_threshold=2, timer=clock)
+
+        def slow_load():
+            clock.now += 2
+            return "user1"
+
+        async def slow_async_load():
+            return slow_load()
+
+        assert await breaker.call(1, slow_async_load) == "user1"
+        assert breaker.state == BREAKER_CLOSED
+        assert breaker.call_sync(1, slow_load) == "user1"
+        assert breaker.state == BREAKER_OPEN
+        assert breaker.timeouts == 2
+        assert isinstance(breaker.last_error, TimeoutError)
+        assert breaker.call_sync(1, slow_load) == "user1"
+        assert breaker.rejected == 1
+
+    async def test_closed_error_raised(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        manager = self.create_manager(breaker, fail=True)
+
+        with pytest.raises(ConnectionError):
+            await manager.load_user(None, 1)
+        assert breaker.errors == 1
+        assert await manager.load_user(None, 1) is None
+        assert breaker.state == BREAKER_OPEN
+
+    async def test_single_trial_call(self):
+        clock = Clock()
+        breaker = CircuitBreaker(
+            failure_threshold=1, reset_timeout=10, timer=clock
+        )
+
+        async def fail():
+            raise ConnectionError("database down")
+
+        async def load():
+            await asyncio.sleep(0.01)
+            return "user1"
+
+        await breaker.call(1, fail)
+        clock.now = 10
+        results = await asyncio.gather(
+            *[breaker.call(1, load) for _ in range(3)]
+        )
+
+        assert results == ["user1", None, None]
+        assert breaker.rejected == 2
+        assert breaker.state == BREAKER_CLOSED
+
+    async def test_stale_user(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        manager = self.create_manager(breaker, fail=False)
+        assert (await manager.load_user(None, 1)).username == "user1"
+
+        manager = self.create_manager(breaker, fail=True)
+        assert (await manager.load_user(None, 1)).username == "user1"
+        assert await manager.load_user(None, 2) is None
+        assert breaker.stats["fallbacks"] == 2
+
+    async def test_deleted_user_not_stale(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        users = {1: "user1"}
+
+        async def load():
+            return users.get(1)
+
+        async def fail():
+            raise ConnectionError("database down")
+
+        assert await breaker.call(1, load) == "user1"
+        del users[1]
+        assert await breaker.call(1, load) is None
+        assert await breaker.call(1, fail) is None
+
+    async def test_logout_all_invalidates_stale(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        manager = self.create_manager(breaker, fail=False)
+        manager.set_generation_store(MemoryGenerationStore())
+        await manager.load_user(None, 1)
+        assert breaker.stale.get_user(1) is not None
+
+        manager.logout_all(1)
+        assert len(breaker.stale) == 0
+
+    async def test_anonymous(self):
+        breaker = CircuitBreaker(failure_threshold=1, fallback="anonymous")
+        manager = self.create_manager(breaker, fail=False)
+        await manager.load_user(None, 1)
+
+        manager = self.create_manager(breaker, fail=True)
+        assert await manager.load_user(None, 1) is None
+        assert breaker.stale is None
+
+    async def test_sync_and_single_flight(self):
+        breaker = CircuitBreaker(failure_threshold=1, fallback="anonymous")
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_circuit_breaker(breaker)
+        manager.set_single_flight(SingleFlight())
+
+        def loader(request, user_id):
+            raise ConnectionError("database down")
+
+        manager.set_user_loader(loader)
+        assert manager.load_user_sync(None, 1) is None
+        assert await manager.load_user(None, 1) is None
+        assert breaker.errors == 1
+        assert breaker.rejected == 1
+
+    async def test_authentication_degrades(self, app_factory):
+        breaker = CircuitBreaker(failure_threshold=1, fallback="anonymous")
+        manager = self.create_manager(breaker, fail=True)
+        client = TestClient(app_factory(manager))
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+
+        resp = client.get("/protected", follow_redirects=False)
+        assert resp.status_code == 302
+        assert breaker.state == BREAKER_OPEN
+
+    async def test_fallback_not_authenticated(self):
+        breaker = CircuitBreaker(failure_threshold=1, fallback="anonymous")
+        manager = self.create_manager(breaker, fail=True)
+        conn = HTTPConnection(
+            {"type": "http", "headers": [], "session": {"_user_id": 1}}
+        )
+
+        credentials, user = await SessionAuthBackend(manager).authenticate(
+            conn
+        )
+
+        assert credentials.scopes == []
+        assert user is manager.anonymous_user
@@ -0,0 +1,114 @@
+import pytest
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from starlette_login.loader import LoaderExecutor
+from starlette_login.login_manager import (
+    LOADER_ASYNC,
+    LOADER_EXECUTOR,
+    LOADER_SYNC,
+    Config,
+    LoginManager,
+    ProtectionLevel,
+)
+
+from .model import user_list
+
+
+class TestRuntimePlan:
+    def create_manager(self, **config):
+        manager = LoginManager(
+            redirect_to="login", secret_key="secret", config=Config(**config)
+        )
+        manager.set_user_loader(user_list.user_loader)
+        return manager
+
+    def test_precomputed(self):
+        manager = self.create_manager(
+            protection_level=ProtectionLevel.Strong,
+            EXEMPT_METHODS=("OPTIONS", "HEAD"),
+        )
+        plan = manager.get_plan()
+
+        assert plan is manager.get_plan()
+        assert plan.protection_is_strong is True
+        assert plan.exempt_methods == frozenset({"OPTIONS", "HEAD"})
+        assert plan.session_keys == manager.config.session_keys
+        assert plan.loader_kind == LOADER_SYNC
+        assert plan.cookie_template is manager.cookie_template
+
+    def test_immutable(self):
+        plan = self.create_manager().get_plan()
+
+        with pytest.raises(AttributeError):
+            plan.protection_is_strong = True
+        assert not hasattr(plan, "__dict__")
+
+    def test_loader_change_recompiles(self):
+        manager = self.create_manager()
+        assert manager.get_plan().loader_kind == LOADER_SYNC
+
+        manager.set_user_loader(user_list.async_user_loader)
+        assert manager.get_plan().loader_kind == LOADER_ASYNC
+
+        manager.set_user_loader(user_list.user_loader)
+        manager.set_loader_executor(LoaderExecutor(max_workers=1))
+        assert manager.get_plan().loader_kind == LOADER_EXECUTOR
+        manager.loader_executor.shutdown()
+
+    def test_compiled_on_startup(self, app_factory):
+        manager = self.create_manager()
+        app = app_factory(manager)
+
+        with TestClient(app) as client:
+            plan = manager.get_plan()
+            assert id(app) in plan.redirect_paths
+
+            resp = client.get("/protected", follow_redirects=False)
+            assert resp.headers["location"].startswith(
+                "http://testserver/login?next="
+            )
+            assert manager.get_plan() is plan
+
+    def test_redirect_url(self, app_factory):
+        manager = self.create_manager()
+        app = app_factory(manager)
+        request = Request(
+            {
+                "type": "http",
+                "app": app,
+                "scheme": "https",
+                "server": ("example.com", 443),
+                "root_path": "/prefix",
+                "path": "/",
+                "headers": [],
+            }
+        )
+
+        assert manager.build_redirect_url(request) == request.url_for("login")
+        assert manager.build_redirect_url(request) == request.url_for("login")
+
+        manager.redirect_to = "/login"
+        assert manager.compile().redirect_url(request) == "/login"
+
+    def test_login_redirect_cached(self, app_factory):
+        manager = self.create_manager(REDIRECT_CACHE_SIZE=2)
+        client = TestClient(app_factory(manager))
+        cache = manager.get_plan().redirect_cache
+
+        resp = client.get("/protected?page=1", follow_redirects=False)
+        assert resp.headers["location"] == (
+            "http://testserver/login?next=/protected%3Fpage%3D1"
+        )
+        resp = client.get("/protected", follow_redirects=False)
+        assert resp.headers["location"] == (
+            "http://testserver/login?next=/protected"
+        )
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        for host in ("a.example.com", "b.example.com", "c.example.com"):
+            resp = client.get(
+                "/protected", headers={"host": host}, follow_redirects=False
+            )
+            assert resp.headers["location"].startswith(f"http://{host}/login")
+        assert len(cache) == 2
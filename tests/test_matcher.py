@@ -0,0 +1,69 @@
+import re
+
+from starlette_login.matcher import PathMatcher
+
+
+class TestPathMatcher:
+    def test_empty(self):
+        matcher = PathMatcher()
+
+        assert not matcher
+        assert matcher.match("/") is False
+
+    def test_prefix(self):
+        matcher = PathMatcher(["/static", "/health.check"])
+
+        assert matcher.match("/static/app.js")
+        assert matcher.match("/health.check")
+        assert not matcher.match("/healthxcheck")
+        assert not matcher.match("/api/static")
+
+    def test_glob(self):
+        matcher = PathMatcher(["/api/*/health"])
+
+        assert matcher.match("/api/v1/health")
+        assert not matcher.match("/api/v1/health/more")
+        assert not matcher.match("/api/v1/internal/health")
+
+    def test_glob_segments(self):
+        matcher = PathMatcher(["/docs/**", "/assets/*.js", "/v?/[!_]*"])
+
+        assert matcher.match("/docs/guide/install")
+        assert matcher.match("/assets/app.js")
+        assert not matcher.match("/assets/vendor/app.js")
+        assert matcher.match("/v1/users")
+        assert not matcher.match("/v1/_internal")
+        assert not matcher.match("/v/1/users")
+
+    def test_regex_flags_and_groups(self):
+        matcher = PathMatcher(
+            [
+                re.compile("/admin", re.I),
+                re.compile("(?i)/private"),
+                re.compile(r"/a/(?P<id>\d+)$"),
+                re.compile(r"/b/(?P<id>\d+)$"),
+                "/static",
+            ]
+        )
+
+        assert matcher.match("/ADMIN")
+        assert matcher.match("/Private/x")
+        assert matcher.match("/b/1")
+        assert matcher.match("/static/app.js")
+        assert not matcher.match("/c/1")
+
+    def test_regex(self):
+        matcher = PathMatcher([re.compile(r"/users/\d+/avatar$")])
+
+        assert matcher.match("/users/12/avatar")
+        assert not matcher.match("/users/me/avatar")
+
+    def test_method(self):
+        matcher = PathMatcher([(["get", "HEAD"], "/metrics"), "/static"])
+
+        assert matcher.match("/metrics", "GET")
+        assert matcher.match("/metrics", "HEAD")
+        assert not matcher.match("/metrics", "POST")
+        assert not matcher.match("/metrics")
+        assert matcher.match("/static/app.js", "GET")
+        assert matcher.match("/static/app.js", "POST")
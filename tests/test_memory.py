@@ -0,0 +1,162 @@
+import gc
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+from starlette.datastructures import State
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import PlainTextResponse
+
+from starlette_login.backends import SessionAuthBackend
+from starlette_login.decorator import login_required
+from starlette_login.login_manager import LoginManager
+from starlette_login.middleware import AuthenticationMiddleware
+
+from .model import user_list
+
+# Budgets of one authenticated request through `AuthenticationMiddleware`,
+# `SessionAuthBackend` and `login_required` issuing the remember cookie,
+# about twice the measured values
+PEAK_BYTES_BUDGET = 12 * 1024
+LIBRARY_BLOCKS_BUDGET = 36
+# Memory retained by 900 more requests
+RETAINED_BYTES_BUDGET = 1024
+
+LIBRARY_FILES = "*/starlette_login/*"
+
+
+@login_required
+async def protected_page(request: Request):
+    return PlainTextResponse("protected")
+
+
+async def endpoint(scope, receive, send):
+    response = await protected_page(Request(scope, receive))
+    await response(scope, receive, send)
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}  # pragma: no cover
+
+
+def run(coro):
+    """Run a coroutine that never suspends, without an event loop"""
+    try:
+        coro.send(None)
+    except StopIteration as exc:
+        return exc.value
+    raise AssertionError("coroutine suspended")  # pragma: no cover
+
+
+def create_authenticated_request():
+    manager = LoginManager(redirect_to="login", secret_key="secret")
+    manager.set_user_loader(user_list.user_loader)
+    app = SimpleNamespace(state=State({"login_manager": manager}))
+    middleware = AuthenticationMiddleware(
+        endpoint, SessionAuthBackend(manager), manager
+    )
+    headers = [(b"host", b"testserver"), (b"user-agent", b"pytest")]
+    base_scope = {
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 50000),
+        "root_path": "",
+        "path": "/protected",
+        "query_string": b"",
+        "headers": headers,
+        "app": app,
+    }
+    session = {
+        "_user_id": 1,
+        "_fresh": True,
+        "_remember": "set",
+        "_id": manager.create_identifier(HTTPConnection(base_scope)),
+    }
+
+    def request(send):
+        scope = dict(base_scope, session=dict(session))
+        run(middleware(scope, receive, send))
+        return scope
+
+    async def send(message):
+        pass
+
+    # Warm up the runtime plan and the memoized identifier
+    for _ in range(3):
+        scope = request(send)
+    assert scope["user"].identity == 1
+    return request
+
+
+@pytest.fixture
+def authenticated_request():
+    return create_authenticated_request()
+
+
+def measure(func):
+    gc.collect()
+    # Fresh start, the peak is reset (`tracemalloc.reset_peak` is 3.9+)
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current - start, peak - start
+
+
+class TestMemoryBudget:
+    def test_peak_bytes(self, authenticated_request):
+        async def send(message):
+            pass
+
+        _, peak = measure(lambda: authenticated_request(send))
+        assert peak < PEAK_BYTES_BUDGET
+
+    def test_no_retained_memory(self, authenticated_request):
+        async def send(message):
+            pass
+
+        def requests(number):
+            for _ in range(number):
+                authenticated_request(send)
+
+        # Compared to 100 requests, filling the interpreter free lists
+        retained_100, _ = measure(lambda: requests(100))
+        retained_1000, _ = measure(lambda: requests(1000))
+        assert retained_1000 - retained_100 < RETAINED_BYTES_BUDGET
+
+    def test_library_blocks(self, authenticated_request):
+        """Memory blocks of the library alive when the response starts"""
+        snapshots = []
+        messages = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                snapshots.append(tracemalloc.take_snapshot())
+            messages.append(message)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            authenticated_request(send)
+        finally:
+            tracemalloc.stop()
+
+        library = [tracemalloc.Filter(True, LIBRARY_FILES)]
+        stats = (
+            snapshots[0]
+            .filter_traces(library)
+            .compare_to(before.filter_traces(library), "filename")
+        )
+        blocks = sum(stat.count_diff for stat in stats)
+        assert 0 < blocks < LIBRARY_BLOCKS_BUDGET
+
+        # The remember cookie is rendered without `SimpleCookie`
+        assert b"set-cookie" in dict(messages[0]["headers"])
+        cookies = [tracemalloc.Filter(True, "*/http/cookies.py")]
+        assert not snapshots[0].filter_traces(cookies).traces
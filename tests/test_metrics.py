@@ -0,0 +1,93 @@
+from starlette.testclient import TestClient
+
+from starlette_login.login_manager import Config, LoginManager, ProtectionLevel
+from starlette_login.metrics import AuthMetrics, MetricsRegistry
+
+from .model import user_list
+
+
+class TestMetricsRegistry:
+    def test_render(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("logins_total", "Logins", ["method"])
+        histogram = registry.histogram("latency_seconds", "Latency", [0.1, 1])
+        counter.inc("password")
+        counter.inc("password", amount=2)
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        assert registry.render() == (
+            "# HELP logins_total Logins\n"
+            "# TYPE logins_total counter\n"
+            'logins_total{method="password"} 3.0\n'
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{le="0.1"} 1.0\n'
+            'latency_seconds_bucket{le="1.0"} 2.0\n'
+            'latency_seconds_bucket{le="+Inf"} 3.0\n'
+            "latency_seconds_sum 5.6\n"
+            "latency_seconds_count 3.0\n"
+        )
+
+    def test_endpoint(self):
+        metrics = AuthMetrics()
+        resp = TestClient(metrics).get("/metrics")
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/plain")
+        assert "starlette_login_redirects_total 0.0" in resp.text
+
+
+class TestAuthMetrics:
+    def create_client(self, app_factory, **config):
+        manager = LoginManager(
+            redirect_to="login", secret_key="secret", config=Config(**config)
+        )
+        manager.set_user_loader(user_list.user_loader)
+        metrics = AuthMetrics()
+        manager.set_metrics(metrics)
+        return TestClient(app_factory(manager)), manager, metrics
+
+    def test_outcomes(self, app_factory):
+        client, _, metrics = self.create_client(app_factory)
+
+        client.get("/protected", follow_redirects=False)
+        assert metrics.requests.get("anonymous") == 1
+        assert metrics.redirects.get() == 1
+
+        client.post(
+            "/login",
+            data={"username": "user1", "password": "password", "remember": 1},
+        )
+        client.get("/protected")
+        assert metrics.requests.get("authenticated") >= 1
+        assert metrics.authenticate_seconds.count >= 1
+        assert metrics.user_loader_seconds.count >= 1
+        assert metrics.fingerprint_seconds.count >= 1
+
+        # Session lost, the remember cookie restores the user
+        client.cookies.delete("session")
+        assert client.get("/protected").status_code == 200
+        assert metrics.remember_restored.get() == 1
+        assert metrics.cookie_decode_seconds.count == 1
+
+    def test_strong_protection_wipe(self, app_factory):
+        client, _, metrics = self.create_client(
+            app_factory, protection_level=ProtectionLevel.Strong
+        )
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+        client.headers["user-agent"] = "changed"
+        client.get("/protected", follow_redirects=False)
+
+        assert metrics.strong_protection_wipes.get() == 1
+        assert metrics.redirects.get() == 1
+
+    def test_disabled(self, app_factory):
+        client, manager, metrics = self.create_client(app_factory)
+        manager.set_metrics(None)
+        client.get("/protected", follow_redirects=False)
+
+        assert metrics.requests.values == {}
@@ -1,9 +1,14 @@
 import pytest
+from starlette.authentication import AuthCredentials
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, StreamingResponse
 from starlette.testclient import TestClient
 
+from starlette_login.backends import SessionAuthBackend
+from starlette_login.login_manager import LoginManager
+from starlette_login.middleware import AuthenticationMiddleware
 from starlette_login.utils import login_user
+from tests.extension import login_manager
 from tests.model import user_list
 
 
@@ -34,3 +39,115 @@ class TestAuthenticationMiddleware:
         resp = test_client.get("/excluded")
 
         assert resp.json()["user"] is None
+
+    async def test_excluded_pattern(self, app_factory):
+        client = TestClient(
+            app_factory(login_manager, excluded_dirs=[(["GET"], "/exclu*")])
+        )
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+
+        assert client.get("/excluded").json()["user"] is None
+
+    async def test_included(self, app_factory):
+        client = TestClient(
+            app_factory(login_manager, included_dirs=["/login", "/protected"])
+        )
+        client.post(
+            "/login",
+            data={"username": "user1", "password": "password"},
+            follow_redirects=False,
+        )
+
+        assert client.get("/protected").status_code == 200
+        assert client.get("/excluded").json()["user"] is None
+
+    async def test_anonymous_no_session_write(self, test_client):
+        resp = test_client.get("/")
+        assert b"You are not logged in" in resp.content
+        assert "set-cookie" not in resp.headers
+
+    async def test_anonymous_no_session_write_strong(self, secure_test_client):
+        resp = secure_test_client.get("/")
+        assert b"You are not logged in" in resp.content
+        assert "set-cookie" not in resp.headers
+
+    async def test_anonymous_shared_user(self):
+        backend = SessionAuthBackend(login_manager)
+
+        assert backend.is_anonymous({"session": {}, "headers": []})
+        assert not backend.is_anonymous(
+            {"session": {}, "headers": [(b"cookie", b"remember_token=1")]}
+        )
+        assert not backend.is_anonymous({"session": {"_fresh": False}})
+        assert login_manager.anonymous_user is login_manager.anonymous_user
+
+    async def test_anonymous_fast_path_subclass(self, app_factory):
+        class TokenBackend(SessionAuthBackend):
+            async def authenticate(self, conn):
+                if conn.headers.get("X-Token") == "user1":
+                    return AuthCredentials(
+                        ["authenticated"]
+                    ), user_list.get_by_id(1)
+                return await super().authenticate(conn)
+
+        client = TestClient(
+            app_factory(login_manager, backend=TokenBackend(login_manager))
+        )
+
+        resp = client.get("/protected", headers={"X-Token": "user1"})
+        assert resp.status_code == 200
+        assert b"user1" in resp.content
+
+    async def test_remember_cookie_only(self, test_client):
+        test_client.cookies["remember_token"] = (
+            login_manager.cookie_codec.encode(1)
+        )
+
+        resp = test_client.get("/protected")
+        assert resp.status_code == 200
+        assert b"user1" in resp.content
+
+    async def test_remember_cookie_on_response_start_only(self, monkeypatch):
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(user_list.user_loader)
+        calls = []
+        set_cookie = manager.set_cookie
+
+        def counted_set_cookie(message, user_id, duration=None):
+            calls.append(message["type"])
+            return set_cookie(message, user_id, duration)
+
+        monkeypatch.setattr(manager, "set_cookie", counted_set_cookie)
+
+        async def chunks():
+            for _ in range(3):
+                yield b"chunk"
+
+        async def streaming_app(scope, receive, send):
+            await StreamingResponse(chunks())(scope, receive, send)
+
+        middleware = AuthenticationMiddleware(
+            streaming_app, SessionAuthBackend(manager), manager
+        )
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": [],
+            "session": {"_user_id": 1, "_remember": "set"},
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.disconnect"}  # pragma: no cover
+
+        async def send(message):
+            messages.append(message)
+
+        await middleware(scope, receive, send)
+
+        assert calls == ["http.response.start"]
+        assert [m["type"] for m in messages].count("http.response.body") == 4
+        assert b"set-cookie" in dict(messages[0]["headers"])
@@ -1,4 +1,16 @@
-from starlette_login.mixins import AnonymousUser, UserMixin
+import asyncio
+
+import pytest
+
+from starlette_login.login_manager import LoginManager
+from starlette_login.mixins import (
+    AnonymousUser,
+    LazyUser,
+    UserMixin,
+    user_is_authenticated,
+)
+
+from .model import user_list
 
 
 class TestUserMixinTest:
@@ -13,3 +25,65 @@ class TestUserMixinTest:
         user = UserMixin()
 
         assert user.is_authenticated is True
+
+
+class TestLazyUser:
+    def create(self, loader, user_id=1):
+        calls = []
+
+        def counted_loader(request, user_id):
+            calls.append(user_id)
+            return loader(request, user_id)
+
+        async def async_counted_loader(request, user_id):
+            calls.append(user_id)
+            return await loader(request, user_id)
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        if asyncio.iscoroutinefunction(loader):
+            manager.set_user_loader(async_counted_loader)
+        else:
+            manager.set_user_loader(counted_loader)
+        return LazyUser(None, manager, user_id), calls
+
+    def test_identity_does_not_load(self):
+        lazy, calls = self.create(user_list.user_loader)
+
+        assert lazy.identity == 1
+        assert user_is_authenticated(lazy) is True
+        assert lazy.is_loaded is False
+        assert calls == []
+
+    def test_attribute_access_loads_once(self):
+        lazy, calls = self.create(user_list.user_loader)
+
+        assert lazy.is_authenticated is True
+        assert lazy.display_name == "user1"
+        assert lazy.username == "user1"
+        assert calls == [1]
+
+    def test_missing_user(self):
+        lazy, calls = self.create(user_list.user_loader, user_id=99)
+
+        assert user_is_authenticated(lazy) is True
+        assert lazy.is_authenticated is False
+        assert user_is_authenticated(lazy) is False
+        assert lazy.identity is None
+
+    def test_async_loader_requires_load(self):
+        lazy, _ = self.create(user_list.async_user_loader)
+
+        assert user_is_authenticated(lazy) is True
+        with pytest.raises(RuntimeError):
+            lazy.is_authenticated
+        with pytest.raises(RuntimeError):
+            lazy.display_name
+
+    @pytest.mark.asyncio
+    async def test_async_load(self):
+        lazy, calls = self.create(user_list.async_user_loader)
+
+        user = await lazy.load()
+        assert user.username == "user1"
+        assert lazy.display_name == "user1"
+        assert calls == [1]
@@ -0,0 +1,140 @@
+import pytest
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.testclient import TestClient
+
+from starlette_login.decorator import login_required, public
+from starlette_login.login_manager import LoginManager
+from starlette_login.policy import AuthPolicy, RoutePolicyIndex
+
+from .conftest import routes
+from .model import user_list
+
+
+@public
+def public_page(request):
+    pass  # pragma: no cover
+
+
+@login_required
+def private_page(request):
+    pass  # pragma: no cover
+
+
+def scope(path, scope_type="http", method="GET"):
+    return {"type": scope_type, "path": path, "method": method}
+
+
+class TestRoutePolicyIndex:
+    def test_static(self):
+        index = RoutePolicyIndex(
+            [Route("/", public_page), Route("/private", private_page)]
+        )
+
+        assert index.get(scope("/")) is AuthPolicy.Public
+        assert index.get(scope("/private")) is AuthPolicy.Login
+        assert index.get(scope("/unknown")) is None
+
+    def test_path_params_in_order(self):
+        index = RoutePolicyIndex(
+            [
+                Route("/users/{name}", private_page),
+                Route("/users/me", public_page),
+            ]
+        )
+
+        assert index.get(scope("/users/me")) is AuthPolicy.Login
+        assert index.get(scope("/users/other")) is AuthPolicy.Login
+
+    def test_same_path_methods(self):
+        index = RoutePolicyIndex(
+            [
+                Route("/x", public_page, methods=["GET"]),
+                Route("/x", private_page, methods=["POST"]),
+                Route("/y", private_page, methods=["POST"]),
+            ]
+        )
+
+        assert index.get(scope("/x")) is AuthPolicy.Public
+        assert index.get(scope("/x", method="POST")) is AuthPolicy.Login
+        # No full match, policy of the first route of the path
+        assert index.get(scope("/x", method="PUT")) is AuthPolicy.Public
+        assert index.get(scope("/y", method="GET")) is AuthPolicy.Login
+
+    def test_mount_and_websocket(self):
+        index = RoutePolicyIndex(
+            [
+                Mount("/static", routes=[Route("/", public_page)]),
+                WebSocketRoute("/ws", private_page),
+            ]
+        )
+
+        assert index.get(scope("/static/")) is None
+        assert index.get(scope("/ws")) is None
+        assert index.get(scope("/ws", "websocket")) is AuthPolicy.Login
+
+    def test_decorators(self):
+        policies = {
+            route.path: getattr(route.endpoint, "__auth_policy__", None)
+            for route in routes
+        }
+
+        assert policies["/"] is None
+        assert policies["/public"] is AuthPolicy.Public
+        assert policies["/protected"] is AuthPolicy.Login
+        assert policies["/sync_protected"] is AuthPolicy.Login
+        assert policies["/fresh"] is AuthPolicy.FreshLogin
+        assert policies["/fresh_async"] is AuthPolicy.FreshLogin
+        assert policies["/ws"] is AuthPolicy.Login
+        assert policies["/login"] is None
+
+
+@pytest.mark.asyncio
+class TestRoutePolicyMiddleware:
+    def create_client(self, app_factory):
+        calls = []
+
+        def loader(request, user_id):
+            calls.append(user_id)
+            return user_list.user_loader(request, user_id)
+
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(loader)
+        client = TestClient(app_factory(manager, route_policies=True))
+        return client, calls
+
+    async def test_public_route_not_authenticated(self, app_factory):
+        client, calls = self.create_client(app_factory)
+        client.post(
+            "/login",
+            data={"username": "user1", "password": "password"},
+            follow_redirects=False,
+        )
+
+        resp = client.get("/public")
+        assert resp.json() == {"authenticated": False}
+        assert calls == []
+
+        resp = client.get("/")
+        assert b"You are logged in as user1" in resp.content
+
+    async def test_protected_route_redirect(self, app_factory):
+        client, _ = self.create_client(app_factory)
+
+        resp = client.get("/protected?page=1", follow_redirects=False)
+        assert resp.status_code == 302
+        assert resp.headers["location"] == (
+            "http://testserver/login?next=/protected%3Fpage%3D1"
+        )
+
+        resp = client.get("/fresh", follow_redirects=False)
+        assert resp.status_code == 302
+
+    async def test_protected_route_logged_in(self, app_factory):
+        client, calls = self.create_client(app_factory)
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+
+        resp = client.get("/protected")
+        assert resp.status_code == 200
+        assert b"user1" in resp.content
@@ -0,0 +1,168 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.testclient import TestClient
+
+from starlette_login.backends import SessionAuthBackend
+from starlette_login.middleware import AuthenticationMiddleware
+from starlette_login.session import (
+    MemorySessionStore,
+    RedisSessionStore,
+    ServerSessionMiddleware,
+    SQLiteSessionStore,
+    create_session_id,
+    is_session_id,
+)
+
+from .conftest import routes
+from .extension import login_manager
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in of `redis.Redis`"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+        self.expires[key] = ex
+        return True
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+
+class AsyncFakeRedis(FakeRedis):
+    async def get(self, key):
+        return super().get(key)
+
+    async def set(self, key, value, ex=None):
+        return super().set(key, value, ex)
+
+    async def delete(self, key):
+        return super().delete(key)
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis", "async_redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore()
+    elif request.param == "sqlite":
+        return SQLiteSessionStore(str(tmp_path / "session.db"))
+    elif request.param == "redis":
+        return RedisSessionStore(FakeRedis())
+    return RedisSessionStore(AsyncFakeRedis())
+
+
+@pytest.fixture
+def store_client(store):
+    middlewares = [
+        Middleware(ServerSessionMiddleware, store=store),
+        Middleware(
+            AuthenticationMiddleware,
+            backend=SessionAuthBackend(login_manager),
+            login_manager=login_manager,
+        ),
+    ]
+    application = Starlette(routes=routes, middleware=middlewares)
+    application.state.login_manager = login_manager
+    return TestClient(application)
+
+
+def test_session_id():
+    session_id = create_session_id()
+
+    assert is_session_id(session_id)
+    assert not is_session_id(session_id[:-1])
+    assert not is_session_id(session_id[:-1] + "|")
+
+
+@pytest.mark.asyncio
+class TestServerSessionMiddleware:
+    async def test_login(self, store_client):
+        resp = store_client.post(
+            "/login",
+            data={"username": "user1", "password": "password"},
+            follow_redirects=False,
+        )
+        session_id = resp.cookies["session"]
+        assert is_session_id(session_id)
+
+        resp = store_client.get("/protected")
+        assert resp.status_code == 200
+        assert b"user1" in resp.content
+
+    async def test_unchanged_session_not_saved(self, store_client):
+        store_client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+
+        resp = store_client.get("/protected")
+        assert resp.status_code == 200
+        assert "set-cookie" not in resp.headers
+
+    async def test_logout(self, store_client):
+        store_client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+        store_client.get("/logout")
+
+        resp = store_client.get("/protected", follow_redirects=False)
+        assert resp.status_code == 302
+
+    async def test_login_rotates_session_id(self, store, store_client):
+        # Session id planted before login, e.g. session fixation
+        planted = create_session_id()
+        await store.save(planted, {"next": "/protected"}, 60)
+        store_client.cookies["session"] = planted
+
+        resp = store_client.post(
+            "/login",
+            data={"username": "user1", "password": "password"},
+            follow_redirects=False,
+        )
+        session_id = resp.cookies["session"]
+        assert session_id != planted
+        assert await store.load(planted) is None
+        assert (await store.load(session_id))["_user_id"] == 1
+
+    async def test_unknown_session_id(self, store_client):
+        store_client.cookies["session"] = create_session_id()
+
+        resp = store_client.get("/protected", follow_redirects=False)
+        assert resp.status_code == 302
+
+
+@pytest.mark.asyncio
+class TestSessionStore:
+    async def test_save_load_delete(self, store):
+        await store.save("sid", {"_user_id": 1}, 60)
+        assert await store.load("sid") == {"_user_id": 1}
+
+        await store.delete("sid")
+        assert await store.load("sid") is None
+
+    async def test_memory_expired(self):
+        store = MemorySessionStore()
+        await store.save("sid", {"_user_id": 1}, -1)
+
+        assert await store.load("sid") is None
+
+    async def test_sqlite_expired(self, tmp_path):
+        store = SQLiteSessionStore(str(tmp_path / "session.db"))
+        await store.save("sid", {"_user_id": 1}, -1)
+
+        assert await store.load("sid") is None
+        store.close()
+
+    async def test_redis_expiry(self):
+        client = FakeRedis()
+        store = RedisSessionStore(client, prefix="s:")
+        await store.save("sid", {}, 60)
+
+        assert client.expires == {"s:sid": 60}
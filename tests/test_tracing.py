@@ -0,0 +1,121 @@
+import pytest
+from starlette.testclient import TestClient
+
+from starlette_login.login_manager import LoginManager
+from starlette_login.tracing import AuthTrace, InMemoryExporter, SpanHooks
+
+from .model import user_list
+
+
+class TestAuthTrace:
+    def test_server_timing(self):
+        events = []
+
+        class Hooks(SpanHooks):
+            def on_start(self, span, scope):
+                events.append(("start", span.name))
+
+            def on_end(self, span, scope):
+                events.append(("end", span.name))
+
+        trace = AuthTrace({}, Hooks())
+        outer = trace.start("auth")
+        inner = trace.start("auth-session")
+        assert inner.duration == 0.0
+        trace.end(inner)
+        trace.end(outer)
+
+        assert events == [
+            ("start", "auth"),
+            ("start", "auth-session"),
+            ("end", "auth-session"),
+            ("end", "auth"),
+        ]
+        assert outer.duration >= inner.duration > 0
+        names = [
+            part.split(";")[0] for part in trace.server_timing().split(", ")
+        ]
+        assert names == ["auth-session", "auth"]
+
+        message = trace.add_header({"type": "http.response.start"})
+        assert message["headers"][0][0] == b"server-timing"
+
+    def test_no_spans_no_header(self):
+        message = {"type": "http.response.start", "headers": []}
+        assert AuthTrace({}).add_header(message)["headers"] == []
+
+
+class TestTracingMiddleware:
+    def create_client(self, app_factory, **kwargs):
+        manager = LoginManager(redirect_to="login", secret_key="secret")
+        manager.set_user_loader(user_list.user_loader)
+        return TestClient(app_factory(manager, **kwargs))
+
+    def login(self, client):
+        client.post(
+            "/login",
+            data={"username": "user1", "password": "password", "remember": 1},
+        )
+
+    def test_server_timing_header(self, app_factory):
+        client = self.create_client(app_factory, server_timing=True)
+        assert "server-timing" not in client.get("/").headers
+
+        self.login(client)
+        timing = client.get("/protected").headers["server-timing"]
+        names = [part.split(";")[0] for part in timing.split(", ")]
+        assert names == [
+            "auth-identifier",
+            "auth-session",
+            "auth-user-loader",
+            "auth",
+        ]
+
+        # Session lost, the remember cookie restores the user
+        client.cookies.delete("session")
+        timing = client.get("/protected").headers["server-timing"]
+        assert "auth-cookie;dur=" in timing
+
+    def test_span_hooks(self, app_factory):
+        exporter = InMemoryExporter()
+        client = self.create_client(app_factory, span_hooks=exporter)
+        self.login(client)
+        exporter.clear()
+
+        resp = client.get("/protected")
+        assert "server-timing" not in resp.headers
+        assert exporter.names() == [
+            "auth-identifier",
+            "auth-session",
+            "auth-user-loader",
+            "auth",
+        ]
+        assert all(span.duration > 0 for span in exporter.spans)
+
+    def test_loader_error_ends_spans(self, app_factory):
+        started = []
+
+        class Exporter(InMemoryExporter):
+            def on_start(self, span, scope):
+                started.append(span.name)
+
+        exporter = Exporter()
+        client = self.create_client(app_factory, span_hooks=exporter)
+        self.login(client)
+        manager = client.app.state.login_manager
+        started.clear()
+        exporter.clear()
+
+        def failing_loader(request, user_id):
+            raise RuntimeError("database down")
+
+        manager.set_user_loader(failing_loader)
+        with pytest.raises(RuntimeError):
+            client.get("/protected")
+        assert sorted(exporter.names()) == sorted(started)
+        assert "auth-user-loader" in started
+
+    def test_disabled(self, app_factory):
+        client = self.create_client(app_factory)
+        self.login(client)
+        assert "server-timing" not in client.get("/protected").headers
@@ -1,6 +1,23 @@
+import time
+from hashlib import sha512
+
 import pytest
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from starlette_login.login_manager import Config, LoginManager, ProtectionLevel
+from starlette_login.session import MemoryGenerationStore, RedisGenerationStore
+from starlette_login.utils import (
+    _fingerprint,
+    build_next_url,
+    create_identifier,
+    decode_cookie,
+    encode_cookie,
+    make_next_url,
+    split_redirect_url,
+)
 
-from starlette_login.utils import decode_cookie, encode_cookie
+from .model import user_list
 
 SECRET_KEY = "secret"
 COOKIE = (
@@ -75,6 +92,111 @@ class TestLogin:
         assert resp.status_code == 302
 
 
+class TestRememberCookie:
+    def create_client(self, app_factory, **config):
+        manager = LoginManager(
+            redirect_to="login", secret_key=SECRET_KEY, config=Config(**config)
+        )
+        manager.set_user_loader(user_list.user_loader)
+        return TestClient(app_factory(manager)), manager
+
+    def login(self, client):
+        return client.post(
+            "/login",
+            data={"username": "user1", "password": "password", "remember": 1},
+            follow_redirects=False,
+        )
+
+    def test_issued_once(self, app_factory):
+        client, _ = self.create_client(app_factory)
+
+        resp = self.login(client)
+        assert "remember_token=" in resp.headers["set-cookie"]
+        assert "remember_token" in client.cookies
+
+        resp = client.get("/protected")
+        assert resp.status_code == 200
+        assert "set-cookie" not in resp.headers
+
+    def test_sliding_refresh(self, app_factory):
+        client, _ = self.create_client(app_factory, COOKIE_REFRESH_AFTER=0)
+        self.login(client)
+
+        resp = client.get("/protected")
+        assert "remember_token=" in resp.headers["set-cookie"]
+
+    def test_sliding_refresh_restored(self, app_factory, monkeypatch):
+        client, manager = self.create_client(app_factory)
+        self.login(client)
+        client.cookies.delete("session")
+
+        resp = client.get("/protected")
+        assert resp.status_code == 200
+        assert "remember_token=" not in resp.headers.get("set-cookie", "")
+
+        # Session lost again, past the refresh of the remember cookie
+        client.cookies.delete("session")
+        duration = manager.config.COOKIE_DURATION.total_seconds()
+        now = time.time() + duration * 0.6
+        monkeypatch.setattr(time, "time", lambda: now)
+        resp = client.get("/protected")
+        assert resp.status_code == 200
+        assert "remember_token=" in resp.headers["set-cookie"]
+
+    def test_restored_keeps_duration(self, app_factory, monkeypatch):
+        client, manager = self.create_client(app_factory)
+        now = int(time.time())
+        client.cookies["remember_token"] = manager.cookie_codec.encode(
+            1, expires=now + 86400, duration=86400
+        )
+
+        resp = client.get("/protected")
+        assert resp.status_code == 200
+        assert "remember_token=" not in resp.headers.get("set-cookie", "")
+
+        # Session lost, past the refresh of the one day remember cookie
+        client.cookies.delete("session")
+        monkeypatch.setattr(time, "time", lambda: now + 86400 * 0.6)
+        resp = client.get("/protected")
+        header = resp.headers["set-cookie"]
+        cookie = header.split("remember_token=")[1].split(";")[0]
+        token = manager.cookie_codec.decode_token(cookie)
+        assert token.duration == 86400
+        assert token.expires == pytest.approx(now + 86400 * 1.6, abs=5)
+
+    def test_remember_cookie_due(self):
+        manager = LoginManager(redirect_to="login", secret_key=SECRET_KEY)
+        duration = manager.config.COOKIE_DURATION.total_seconds()
+        now = time.time()
+
+        assert manager.remember_cookie_due({})
+        assert not manager.remember_cookie_due({"_remember_issued": now})
+        assert manager.remember_cookie_due(
+            {"_remember_issued": now - duration * 0.6}
+        )
+        assert not manager.remember_cookie_due(
+            {"_remember_issued": now - 60, "_remember_seconds": 3600}
+        )
+        assert manager.remember_cookie_due(
+            {"_remember_issued": now - 1800, "_remember_seconds": 3600}
+        )
+        manager.config.COOKIE_REFRESH_AFTER = None
+        assert not manager.remember_cookie_due({"_remember_issued": 0})
+
+    def test_cleared_on_logout(self, app_factory):
+        client, _ = self.create_client(app_factory)
+        self.login(client)
+
+        resp = client.get("/logout", follow_redirects=False)
+        assert "remember_token=" in resp.headers["set-cookie"]
+        assert "Max-Age=0" in resp.headers["set-cookie"]
+        assert "remember_token" not in client.cookies
+
+        resp = client.get("/protected", follow_redirects=False)
+        assert resp.status_code == 302
+        assert "set-cookie" not in resp.headers
+
+
 @pytest.mark.asyncio
 class TestStrongProtection:
     async def test_regular(self, secure_test_client):
@@ -105,6 +227,36 @@ class TestStrongProtection:
         assert '<button type="submit">Login</button>' in resp.text
 
 
+class TestSessionWrites:
+    def test_update_session(self):
+        manager = LoginManager(redirect_to="login", secret_key=SECRET_KEY)
+        session = {"_fresh": True}
+
+        assert manager.update_session(session, "_fresh", False) is True
+        assert manager.update_session(session, "_fresh", False) is False
+        assert manager.update_session(session, "_fresh", 0) is True
+        assert session == {"_fresh": 0}
+        assert manager.session_writes_avoided == 1
+
+    def test_identifier_changed_written_once(self, app_factory):
+        manager = LoginManager(redirect_to="login", secret_key=SECRET_KEY)
+        manager.set_user_loader(user_list.user_loader)
+        client = TestClient(app_factory(manager))
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+
+        client.headers["user-agent"] = "changed"
+        resp = client.get("/request_data")
+        assert resp.json()["session"]["_fresh"] is False
+        assert "set-cookie" in resp.headers
+
+        resp = client.get("/request_data")
+        assert resp.status_code == 200
+        assert "set-cookie" not in resp.headers
+        assert manager.session_writes_avoided == 1
+
+
 @pytest.mark.asyncio
 class TestStrongProtectionRememberMe:
     async def test_regular(self, secure_test_client):
@@ -139,3 +291,247 @@ class TestStrongProtectionRememberMe:
         resp = secure_test_client.get("/request_data")
         assert resp.status_code == 200
         assert '<button type="submit">Login</button>' in resp.text
+
+
+class TestCreateIdentifier:
+    def create_request(self, host="127.0.0.1"):
+        return Request(
+            {
+                "type": "http",
+                "headers": [(b"user-agent", b"testclient")],
+                "client": (host, 123),
+            }
+        )
+
+    def test_sha512_compatible(self):
+        base = "127.0.0.1|" + str(b"testclient")
+        expected = sha512(base.encode("utf8")).hexdigest()
+
+        assert create_identifier(self.create_request()) == expected
+
+    def test_blake2b(self):
+        request = self.create_request()
+        identifier = create_identifier(request, "blake2b", b"key")
+
+        assert len(identifier) == 32
+        assert identifier != create_identifier(request, "blake2b", b"other")
+
+    def test_memoized(self):
+        _fingerprint.cache_clear()
+        create_identifier(self.create_request())
+        create_identifier(self.create_request())
+
+        assert _fingerprint.cache_info().hits == 1
+
+    def test_legacy_identifier_accepted(self, app_factory):
+        config = Config(
+            protection_level=ProtectionLevel.Strong,
+            IDENTIFIER_ALGORITHM="blake2b",
+        )
+        manager = LoginManager(
+            redirect_to="login", secret_key="secret", config=config
+        )
+        manager.set_user_loader(user_list.user_loader)
+        client = TestClient(app_factory(manager))
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+        request = self.create_request(host="testclient")
+        new_identifier = manager.create_identifier(request)
+        legacy_identifier = create_identifier(request)
+
+        assert manager.is_legacy_identifier(request, legacy_identifier)
+        assert not manager.is_legacy_identifier(request, new_identifier)
+
+        # Session created before switching to blake2b
+        manager.config.IDENTIFIER_ALGORITHM = "sha512"
+        client.post(
+            "/login", data={"username": "user1", "password": "password"}
+        )
+        manager.config.IDENTIFIER_ALGORITHM = "blake2b"
+
+        resp = client.get("/request_data")
+        assert resp.status_code == 200
+        assert resp.json()["session"]["_id"] == new_identifier
+
+
+class TestLoginManagerCookie:
+    def test_verified_cookie_cached(self, monkeypatch):
+        manager = LoginManager(redirect_to="login", secret_key=SECRET_KEY)
+        calls = []
+        decode = manager.cookie_codec.decode_token
+
+        def counted_decode(cookie):
+            calls.append(cookie)
+            return decode(cookie)
+
+        monkeypatch.setattr(
+            manager.cookie_codec, "decode_token", counted_decode
+        )
+
+        assert manager.get_cookie(COOKIE) == "1"
+        assert manager.get_cookie(COOKIE) == "1"
+        assert calls == [COOKIE]
+
+    def test_invalid_cookie_not_cached(self):
+        manager = LoginManager(redirect_to="login", secret_key=SECRET_KEY)
+
+        assert manager.get_cookie("1|invalid") is None
+        assert len(manager.cookie_cache) == 0
+
+    def test_cache_disabled(self):
+        manager = LoginManager(
+            redirect_to="login",
+            secret_key=SECRET_KEY,
+            config=Config(COOKIE_CACHE_SIZE=0),
+        )
+
+        assert manager.cookie_cache is None
+        assert manager.get_cookie(COOKIE) == "1"
+
+
+class TestRememberTokenRevocation:
+    def create_manager(self):
+        manager = LoginManager(redirect_to="login", secret_key=SECRET_KEY)
+        manager.set_user_loader(user_list.user_loader)
+        manager.set_generation_store(MemoryGenerationStore())
+        return manager
+
+    def test_expired(self):
+        manager = self.create_manager()
+        cookie = manager.cookie_codec.encode(1, expires=int(time.time()) - 1)
+
+        assert manager.get_cookie(cookie) is None
+
+    def test_set_cookie_expires(self):
+        manager = self.create_manager()
+        message = manager.set_cookie({}, 1)
+        header = dict(message["headers"])[b"set-cookie"].decode()
+        cookie = header.split(";")[0].split("=", 1)[1]
+        token = manager.cookie_codec.decode_token(cookie)
+        duration = manager.config.COOKIE_DURATION.total_seconds()
+
+        assert token.expires == pytest.approx(time.time() + duration, abs=5)
+        assert manager.get_cookie(cookie) == "1"
+
+    def test_logout_all(self):
+        manager = self.create_manager()
+        cookie = manager.cookie_codec.encode(1, generation=0)
+        assert manager.get_cookie(cookie) == "1"
+
+        manager.logout_all(1)
+
+        assert manager.get_cookie(cookie) is None
+        assert manager.get_cookie(encode_cookie(1, SECRET_KEY)) is None
+        new_cookie = manager.cookie_codec.encode(1, generation=1)
+        assert manager.get_cookie(new_cookie) == "1"
+
+    def test_logout_all_sessions(self, app_factory):
+        manager = self.create_manager()
+        client = TestClient(app_factory(manager))
+        other_client = TestClient(app_factory(manager))
+        for http in (client, other_client):
+            http.post(
+                "/login",
+                data={
+                    "username": "user1",
+                    "password": "password",
+                    "remember": True,
+                },
+            )
+            assert http.get("/protected").status_code == 200
+
+        manager.logout_all(1)
+
+        for http in (client, other_client):
+            resp = http.get("/protected", follow_redirects=False)
+            assert resp.status_code == 302
+
+    def test_redis_generation_store(self):
+        class FakeRedis:
+            def __init__(self):
+                self.data = {}
+
+            def get(self, key):
+                return self.data.get(key)
+
+            def incr(self, key):
+                self.data[key] = int(self.data.get(key, 0)) + 1
+                return self.data[key]
+
+        store = RedisGenerationStore(FakeRedis(), cache_ttl=60)
+
+        assert store.get(1) == 0
+        assert store.bump(1) == 1
+        assert store.get("1") == 1
+
+    def test_redis_generation_store_cache(self):
+        class FakeRedis:
+            gets = 0
+
+            def get(self, key):
+                self.gets += 1
+                return b"2"
+
+        client = FakeRedis()
+        store = RedisGenerationStore(client)
+        assert store.get(1) == 2
+        assert store.get(1) == 2
+        assert client.gets == 1
+
+        store = RedisGenerationStore(client, cache_ttl=None)
+        store.get(1)
+        store.get(1)
+        assert client.gets == 3
+
+
+class TestNextURL:
+    @pytest.mark.parametrize(
+        "redirect_url",
+        [
+            "http://testserver/login",
+            "/login",
+            "/login?lang=en",
+            "http://auth.example.com/login#form",
+        ],
+    )
+    @pytest.mark.parametrize(
+        "path, query_string",
+        [
+            ("/", b""),
+            ("/a b;x", b"page=2&q=%20x"),
+            ("//example.com/x", b""),
+            ("/café", b"a=1"),
+            ("/?", b""),
+            ("/;", b""),
+            ("/a;?b", b"c=1"),
+        ],
+    )
+    def test_same_as_make_next_url(self, redirect_url, path, query_string):
+        scope = {
+            "type": "http",
+            "scheme": "http",
+            "server": ("testserver", 80),
+            "path": path,
+            "query_string": query_string,
+            "headers": [(b"host", b"testserver")],
+        }
+        expected = make_next_url(redirect_url, str(Request(scope).url))
+
+        parts = split_redirect_url(redirect_url)
+        url = build_next_url(parts, scope)
+        if url is None:
+            # Same fallback as `RuntimePlan.login_redirect_url`
+            url = make_next_url(redirect_url, str(Request(scope).url))
+        assert url == expected
+
+    def test_fallback(self):
+        parts = split_redirect_url("https://testserver/login")
+        scope = {"scheme": "http", "server": ("testserver", 80), "path": "/"}
+
+        assert build_next_url(parts, scope) is None
+
+        # Paths that parsing the request URL would truncate
+        parts = split_redirect_url("/login")
+        for path in ("/?", "/;", "/a;?b"):
+            assert build_next_url(parts, dict(scope, path=path)) is None
@@ -12,6 +12,7 @@ from starlette.websockets import WebSocket
 from starlette_login.decorator import (
     fresh_login_required,
     login_required,
+    public,
     ws_login_required,
 )
 from starlette_login.utils import login_user, logout_user
@@ -64,6 +65,11 @@ async def home_page(request: Request):
     return PlainTextResponse(content=content)
 
 
+@public
+async def public_page(request: Request):
+    return JSONResponse({"authenticated": request.user.is_authenticated})
+
+
 @login_required
 async def protected_page(request: Request):
     if getattr(request, "user") is not None: